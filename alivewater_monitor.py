@@ -1,7 +1,23 @@
 import os
+import sys
 import time
+import random
 import json
+import sqlite3
+import atexit
 import logging
+import socket
+import threading
+import urllib3
+try:
+    import fcntl
+except ImportError:
+    # Windows: межпроцессной блокировки нет, остается блокировка потоков
+    fcntl = None
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -9,8 +25,11 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException
 from telegram import Bot
+from telegram.error import RetryAfter
 from telegram.ext import Updater, CommandHandler
+from telegram.utils.request import Request
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,53 +38,822 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Адрес портала переопределяется для локального стенда (benchmarks/fake_portal.py)
+PORTAL_URL = os.getenv("PORTAL_URL", "https://my.alivewater.cloud")
+
 # Конфигурация
 CONFIG = {
-    "login_url": "https://my.alivewater.cloud",
-    "sales_url": "https://my.alivewater.cloud/sales",
-    "terminals_url": "https://my.alivewater.cloud/terminals",
+    "login_url": PORTAL_URL,
+    "sales_url": f"{PORTAL_URL}/sales",
+    "terminals_url": f"{PORTAL_URL}/terminals",
     "telegram_token": os.getenv("TELEGRAM_TOKEN"),
+    "telegram_api_url": os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot"),
     "telegram_admin_ids": [1371753467, 867982256],
+    # Несколько учетных записей дилеров в одном процессе: JSON-список в ACCOUNTS
+    # или в файле ACCOUNTS_FILE; без них используется одна запись из LOGIN/PASSWORD.
+    # Состояние каждой записи хранится в каталоге accounts_dir/<name>
+    "accounts": os.getenv("ACCOUNTS"),
+    "accounts_file": os.getenv("ACCOUNTS_FILE", "accounts.json"),
+    "accounts_dir": os.getenv("ACCOUNTS_DIR", "accounts"),
     "login": os.getenv("LOGIN"),
     "password": os.getenv("PASSWORD"),
-    "data_file": "data.json"
+    "data_file": "data.json",
+    # Сохраненная сессия портала (cookie, localStorage, токен API) рядом с data.json
+    "session_file": os.getenv("SESSION_FILE", "session.json"),
+    "session_max_age": int(os.getenv("SESSION_MAX_AGE", str(7 * 24 * 3600))),
+    # Журнал изменений курсора и полный снимок data.json раз в N записей журнала
+    "state_journal": os.getenv("STATE_JOURNAL", "1") == "1",
+    "state_compact_entries": int(os.getenv("STATE_COMPACT_ENTRIES", "50")),
+    "history_db": os.getenv("HISTORY_DB", "history.db"),
+    # Метрики в формате Prometheus на http://127.0.0.1:METRICS_PORT/metrics, 0 - отключить
+    "metrics_host": os.getenv("METRICS_HOST", "127.0.0.1"),
+    "metrics_port": int(os.getenv("METRICS_PORT", "9108")),
+    # Пул браузерных сессий
+    "browser_pool_size": int(os.getenv("BROWSER_POOL_SIZE", "2")),
+    "browser_max_uses": int(os.getenv("BROWSER_MAX_USES", "50")),
+    "browser_max_rss_mb": int(os.getenv("BROWSER_MAX_RSS_MB", "700")),
+    "browser_acquire_timeout": 120,
+    # Облегченный профиль Chromium: постоянный каталог профиля с дисковым кэшем
+    # (по подкаталогу на браузер пула), уменьшенное окно и блокировка лишних ресурсов
+    "browser_profile_dir": os.getenv("BROWSER_PROFILE_DIR", "chrome-profile"),
+    "browser_cache_mb": int(os.getenv("BROWSER_CACHE_MB", "100")),
+    "browser_window_size": os.getenv("BROWSER_WINDOW_SIZE", "1280,800"),
+    "browser_blocked_urls": [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm",
+        "*google-analytics.com*", "*googletagmanager.com*", "*mc.yandex.ru*"
+    ],
+    # Таймауты явных ожиданий готовности страниц, секунды
+    "wait_timeouts": {
+        "session_check": 10,
+        "popup": 3,
+        "login_form": 10,
+        "login_done": 15,
+        "sales_table": 15,
+        "terminals_list": 15,
+        "network_idle": 5
+    },
+    # Источник данных: "selenium" (рендер SPA) или "http" (JSON API портала)
+    "backend": os.getenv("BACKEND", "selenium"),
+    "api_url": os.getenv("API_URL", f"{PORTAL_URL}/api"),
+    "api_login_path": os.getenv("API_LOGIN_PATH", "/auth/login"),
+    "api_sales_path": os.getenv("API_SALES_PATH", "/sales"),
+    "api_terminals_path": os.getenv("API_TERMINALS_PATH", "/terminals"),
+    "http_timeout": 15,
+    "http_pool_size": 4,
+    # Инкрементальная синхронизация продаж
+    "sales_catchup_max_pages": 10,
+    "terminals_max_pages": 50,
+    # Переходы состояний аппаратов: подтверждение проблемы и восстановления (проверок),
+    # напоминание о затянувшейся проблеме (часов) и окно повторного сбоя (секунд)
+    "terminal_problem_checks": 1,
+    "terminal_recovery_checks": 2,
+    "terminal_reminder_hours": 6,
+    "terminal_flap_window": 3600,
+    "sales_batch_size": 20,
+    "seen_sales_limit": 1000,
+    # Доставка уведомлений: лимиты Telegram ~30 сообщений/с всего и ~1/с на чат
+    "telegram_workers": 4,
+    "telegram_global_rate": 25,
+    "telegram_chat_rate": 1,
+    "telegram_max_attempts": 8,
+    # Пул задач проверки: всего потоков и одновременных задач каждого типа
+    "scrape_workers": 4,
+    "job_limits": {"sales": 1, "terminals": 1},
+    # Кэш последних результатов: свежие данные и предел устаревания, секунды
+    "cache_ttl": {"sales": 60, "terminals": 120},
+    "cache_max_stale": 900,
+    # Адаптивное расписание проверок, секунды; ночь по московскому времени
+    "sales_interval": {"min": 60, "max": 300, "night_max": 900},
+    "terminals_interval": {"day": 300, "night": 900},
+    "sales_per_poll": 1.0,
+    "night_hours": (0, 7),
+    "backoff_base": 60,
+    "backoff_max": 1800,
+    "once_drain_timeout": 60
 }
 
 # Инициализация бота Telegram
-bot = Bot(token=CONFIG['telegram_token'])
+# Пул соединений рассчитан на параллельную отправку в несколько чатов
+bot = Bot(
+    token=CONFIG['telegram_token'],
+    base_url=CONFIG['telegram_api_url'],
+    request=Request(con_pool_size=CONFIG['telegram_workers'] + 2)
+)
 
 # Функция для получения московского времени (UTC+3)
 def moscow_time():
     return datetime.utcnow() + timedelta(hours=3)
 
-def load_data():
+class Metrics:
+    # Счетчики, датчики и длительность этапов цикла мониторинга
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.spans = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, func):
+        # Значение датчика вычисляется в момент чтения метрик
+        self.gauges[name] = func
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            span = self.spans.setdefault(stage, {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0})
+            span["count"] += 1
+            span["sum"] += seconds
+            span["max"] = max(span["max"], seconds)
+            span["last"] = seconds
+
+    @contextmanager
+    def span(self, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            spans = {stage: dict(span) for stage, span in self.spans.items()}
+        gauges = {}
+        for name, func in self.gauges.items():
+            try:
+                gauges[name] = func()
+            except Exception as e:
+                logger.warning(f"Не удалось получить метрику {name}: {str(e)}")
+        return counters, gauges, spans
+
+    def render(self):
+        counters, gauges, spans = self.snapshot()
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE alivewater_{name} counter", f"alivewater_{name} {value}"]
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE alivewater_{name} gauge", f"alivewater_{name} {value}"]
+        lines.append("# TYPE alivewater_stage_seconds summary")
+        for stage, span in sorted(spans.items()):
+            lines.append(f'alivewater_stage_seconds_count{{stage="{stage}"}} {span["count"]}')
+            lines.append(f'alivewater_stage_seconds_sum{{stage="{stage}"}} {span["sum"]:.6f}')
+        lines.append("# TYPE alivewater_stage_last_seconds gauge")
+        for stage, span in sorted(spans.items()):
+            lines.append(f'alivewater_stage_last_seconds{{stage="{stage}"}} {span["last"]:.6f}')
+        lines.append("# TYPE alivewater_stage_max_seconds gauge")
+        for stage, span in sorted(spans.items()):
+            lines.append(f'alivewater_stage_max_seconds{{stage="{stage}"}} {span["max"]:.6f}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def write_json_atomic(path, payload, mode=0o644):
+    # Атомарная запись: временный файл, fsync и os.replace - читатель видит либо
+    # старую, либо новую версию, но не оборванный JSON
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    # Фиксируем сам rename в каталоге
     try:
-        with open(CONFIG['data_file'], 'r') as f:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+class StateStore:
+    # Состояние data.json в памяти процесса. Изменения курсора дописываются в журнал
+    # (data.json.journal) записью постоянного размера, а полный снимок перезаписывается
+    # атомарно раз в state_compact_entries записей журнала. Без журнала снимок пишется
+    # при каждом изменении, иначе перечитывание после записи другого процесса его потеряет.
+    # Блокировка файла (data.json.lock) защищает от параллельного процесса --once,
+    # блокировка потока - от обработчиков команд и планировщика
+    def __init__(self, path, journal=True, compact_entries=50):
+        self.path = path
+        self.backup_path = f"{path}.bak"
+        self.journal_path = f"{path}.journal"
+        self.lock_path = f"{path}.lock"
+        self.journal = journal
+        self.compact_entries = compact_entries
+        self.limits = {"seen_sale_ids": CONFIG['seen_sales_limit']}
+        self._lock = threading.RLock()
+        self._data = None
+        self._seq = 0
+        self._snapshot_seq = 0
+        self._journal_entries = 0
+        self._dirty = False
+        self._signature = None
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _current_signature(self):
+        return (self._stat(self.path), self._stat(self.journal_path))
+
+    @staticmethod
+    def _normalize(data):
+        # Проверяем структуру данных и преобразуем старый формат при необходимости
+        if "last_sale_id" not in data:
+            last_sale_ids = data.get("last_sale_ids") or []
+            data["last_sale_id"] = last_sale_ids[0] if last_sale_ids else ""
+        # Множество уже обработанных продаж появилось вместе с постраничной догрузкой
+        if "seen_sale_ids" not in data:
+            data["seen_sale_ids"] = [data["last_sale_id"]] if data["last_sale_id"] else []
+        data.setdefault("last_notification_urls", [])
+        return data
+
+    def _read_snapshot(self, path):
+        with open(path) as f:
             data = json.load(f)
-            # Проверяем структуру данных и преобразуем при необходимости
-            if "last_sale_id" not in data:
-                # Конвертируем старый формат в новый
-                if "last_sale_ids" in data and data["last_sale_ids"]:
-                    data["last_sale_id"] = data["last_sale_ids"][0] if data["last_sale_ids"] else ""
-                else:
-                    data["last_sale_id"] = ""
-            return data
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"last_sale_id": "", "last_notification_urls": []}
-
-def save_data(data):
-    with open(CONFIG['data_file'], 'w') as f:
-        json.dump(data, f)
-
-def init_browser():
+        if not isinstance(data, dict):
+            raise ValueError("ожидался JSON-объект")
+        return data
+
+    def _load(self):
+        data = None
+        damaged = False
+        for path in (self.path, self.backup_path):
+            try:
+                data = self._read_snapshot(path)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                # Поврежденный снимок не затираем молча: сохраняем копию для разбора
+                logger.error(f"Файл состояния {path} поврежден: {str(e)}")
+                metrics.inc("state_corruptions_total")
+                damaged = True
+                try:
+                    os.replace(path, f"{path}.corrupt-{int(time.time())}")
+                except OSError:
+                    pass
+                continue
+            if path == self.backup_path:
+                logger.warning(f"Состояние восстановлено из резервной копии {path}")
+            break
+
+        if data is None:
+            data = {}
+        seq = data.pop("journal_seq", 0)
+        self._data = self._normalize(data)
+        self._seq = seq
+        self._snapshot_seq = seq
+        self._journal_entries = 0
+        self._replay(seq)
+        if damaged and not self._data["last_sale_id"]:
+            logger.error("Курсор продаж не удалось восстановить ни из снимка, ни из журнала")
+        self._signature = self._current_signature()
+
+    def _replay(self, snapshot_seq):
+        # Записи журнала новее снимка применяем поверх него; оборванная последняя
+        # строка (сбой во время дозаписи) и все после нее отбрасываются
+        try:
+            with open(self.journal_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        replayed = 0
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning("Журнал состояния оборван, последние записи отброшены")
+                break
+            if entry.get("seq", 0) <= snapshot_seq:
+                continue
+            self._journal_entries += 1
+            self._apply(entry.get("set") or {}, entry.get("append") or {})
+            self._seq = entry["seq"]
+            self._dirty = True
+            replayed += 1
+        if replayed:
+            logger.info(f"Из журнала состояния применено {replayed} записей")
+
+    def _apply(self, fields, append):
+        self._data.update(fields)
+        for key, items in append.items():
+            merged = list(dict.fromkeys(list(self._data.get(key, [])) + list(items)))
+            limit = self.limits.get(key)
+            self._data[key] = merged[-limit:] if limit else merged
+
+    def _refresh(self):
+        # Другой процесс мог записать состояние - перечитываем только при изменении файлов
+        if self._data is None or self._current_signature() != self._signature:
+            self._load()
+
+    def get(self):
+        with self._locked():
+            self._refresh()
+            return json.loads(json.dumps(self._data))
+
+    def update(self, fields=None, append=None):
+        # fields заменяют значения, append дописывает элементы в ограниченные списки
+        fields = fields or {}
+        append = append or {}
+        with self._locked():
+            self._refresh()
+            self._seq += 1
+            self._apply(fields, append)
+            self._dirty = True
+            if self.journal:
+                entry = {"seq": self._seq, "set": fields, "append": append}
+                with open(self.journal_path, "a") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._journal_entries += 1
+            else:
+                self._write_snapshot()
+            self._signature = self._current_signature()
+
+    def flush(self, force=False):
+        # Вызывается один раз в конце цикла; с журналом полный снимок пишется
+        # только при накоплении записей, поэтому объем записи не растет с историей
+        with self._locked():
+            # Записи другого процесса уже на диске - подхватываем их перед снимком
+            self._refresh()
+            if not self._dirty:
+                return False
+            if self.journal and not force and self._journal_entries < self.compact_entries:
+                return False
+            with metrics.span("state_flush"):
+                self._write_snapshot()
+            return True
+
+    def _write_snapshot(self):
+        payload = dict(self._data, journal_seq=self._seq)
+        # Предыдущий снимок остается резервной копией (жесткая ссылка, без копирования)
+        if os.path.exists(self.path):
+            try:
+                tmp_backup = f"{self.backup_path}.tmp"
+                if os.path.exists(tmp_backup):
+                    os.remove(tmp_backup)
+                os.link(self.path, tmp_backup)
+                os.replace(tmp_backup, self.backup_path)
+            except OSError as e:
+                logger.debug(f"Резервная копия состояния не создана: {str(e)}")
+        write_json_atomic(self.path, payload)
+        if self.journal:
+            self._trim_journal(self._snapshot_seq)
+        self._snapshot_seq = self._seq
+        self._journal_entries = 0
+        self._dirty = False
+        self._signature = self._current_signature()
+        metrics.inc("state_flushes_total")
+
+    def _trim_journal(self, backup_seq):
+        # Оставляем записи новее резервной копии, чтобы восстановление из нее
+        # не теряло последний цикл; журнал не длиннее двух интервалов снимка.
+        # Снимок уже содержит journal_seq, поэтому сбой до усечения не страшен
+        try:
+            with open(self.journal_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        kept = []
+        for line in lines:
+            try:
+                if json.loads(line).get("seq", 0) > backup_seq:
+                    kept.append(line)
+            except ValueError:
+                break
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def close(self):
+        try:
+            self.flush(force=True)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния: {str(e)}")
+
+def parse_number(text):
+    # "12,5 л" -> 12.5; нечисловые значения считаем нулем
+    cleaned = "".join(ch for ch in str(text).replace(",", ".") if ch.isdigit() or ch in ".-")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return 0.0
+
+def sale_timestamp(sale_time, scraped_at):
+    # В таблице только время продажи, дату берем из момента проверки;
+    # время позже момента проверки означает продажу вчерашнего дня
+    try:
+        parsed = datetime.strptime(sale_time, "%H:%M:%S").time()
+    except (TypeError, ValueError):
+        return scraped_at.strftime("%Y-%m-%d %H:%M:%S")
+    sold_at = datetime.combine(scraped_at.date(), parsed)
+    if sold_at > scraped_at + timedelta(minutes=5):
+        sold_at -= timedelta(days=1)
+    return sold_at.strftime("%Y-%m-%d %H:%M:%S")
+
+class SalesHistory:
+    # Локальная история продаж и состояний аппаратов (только добавление записей).
+    # Записи копятся в буфере и пишутся одной транзакцией в flush()
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sales (
+            number TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            sold_at TEXT NOT NULL,
+            liters REAL NOT NULL,
+            total REAL NOT NULL,
+            payment TEXT NOT NULL,
+            scraped_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sales_sold_at ON sales (sold_at);
+        CREATE INDEX IF NOT EXISTS sales_address ON sales (address, sold_at);
+        CREATE INDEX IF NOT EXISTS sales_payment ON sales (payment, sold_at);
+        CREATE TABLE IF NOT EXISTS terminal_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            terminal TEXT NOT NULL,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL,
+            observed_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS terminal_status_observed ON terminal_status (observed_at);
+        CREATE INDEX IF NOT EXISTS terminal_status_terminal ON terminal_status (terminal, observed_at);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._sales = []
+        self._statuses = []
+
+    def add_sales(self, sales):
+        scraped_at = moscow_time()
+        rows = [
+            (
+                sale["number"], sale["address"], sale_timestamp(sale["time"], scraped_at),
+                parse_number(sale["liters"]), parse_number(sale["total"]), sale["payment"],
+                scraped_at.strftime("%Y-%m-%d %H:%M:%S")
+            )
+            for sale in sales
+        ]
+        with self._lock:
+            self._sales.extend(rows)
+
+    def add_terminal_statuses(self, terminals):
+        observed_at = moscow_time().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._statuses.extend(
+                (t["terminal"], t["url"], t.get("status", "problem"), observed_at) for t in terminals
+            )
+
+    def flush(self):
+        with self._lock:
+            if not self._sales and not self._statuses:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO sales VALUES (?, ?, ?, ?, ?, ?, ?)", self._sales
+                )
+                self.conn.executemany(
+                    "INSERT INTO terminal_status (terminal, url, status, observed_at) VALUES (?, ?, ?, ?)",
+                    self._statuses
+                )
+            self._sales = []
+            self._statuses = []
+
+    def migrate(self, data):
+        # Переносим известные проблемы из data.json один раз, как StateStore._normalize()
+        # переносит last_sale_ids в last_sale_id
+        with self._lock, self.conn:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'data_json_migrated'").fetchone():
+                return
+            observed_at = moscow_time().strftime("%Y-%m-%d %H:%M:%S")
+            self.conn.executemany(
+                "INSERT INTO terminal_status (terminal, url, status, observed_at) VALUES (?, ?, 'problem', ?)",
+                [(url.rstrip("/").rsplit("/", 1)[-1], url, observed_at)
+                 for url in data.get("last_notification_urls", [])]
+            )
+            self.conn.execute("INSERT INTO meta VALUES ('data_json_migrated', ?)", (observed_at,))
+
+    def _query(self, sql, params):
+        self.flush()
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def totals_by_terminal_day(self, since, until):
+        # [(день, адрес, продаж, литров, выручка)] за дни [since, until]
+        return self._query(
+            "SELECT substr(sold_at, 1, 10) AS day, address, COUNT(*), SUM(liters), SUM(total) "
+            "FROM sales WHERE sold_at >= ? AND sold_at < ? "
+            "GROUP BY day, address ORDER BY day, SUM(total) DESC",
+            (since.strftime("%Y-%m-%d"), (until + timedelta(days=1)).strftime("%Y-%m-%d"))
+        )
+
+    def liters_sold(self, since, until):
+        row = self._query(
+            "SELECT COALESCE(SUM(liters), 0) FROM sales WHERE sold_at >= ? AND sold_at < ?",
+            (since.strftime("%Y-%m-%d"), (until + timedelta(days=1)).strftime("%Y-%m-%d"))
+        )
+        return row[0][0]
+
+    def payment_mix(self, since, until):
+        # [(способ оплаты, продаж, выручка)]
+        return self._query(
+            "SELECT payment, COUNT(*), SUM(total) FROM sales "
+            "WHERE sold_at >= ? AND sold_at < ? GROUP BY payment ORDER BY SUM(total) DESC",
+            (since.strftime("%Y-%m-%d"), (until + timedelta(days=1)).strftime("%Y-%m-%d"))
+        )
+
+class TerminalTracker:
+    # Состояние каждого аппарата: ok -> pending -> problem -> recovering -> ok.
+    # В памяти индекс по id, на каждом шаге обходим только текущие проблемы и уже
+    # отслеживаемые неисправные аппараты, а в базу пишем только записи, сменившие
+    # состояние или время оповещения; last_seen и счетчики проверок попадают в базу
+    # вместе с ними, между переходами они живут в памяти
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS terminal_state (
+            id TEXT PRIMARY KEY,
+            terminal TEXT NOT NULL,
+            url TEXT NOT NULL,
+            state TEXT NOT NULL,
+            warning TEXT NOT NULL,
+            first_seen REAL,
+            last_seen REAL,
+            resolved_at REAL,
+            last_alert REAL,
+            flap_count INTEGER NOT NULL,
+            problem_streak INTEGER NOT NULL,
+            ok_streak INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS terminal_state_state ON terminal_state (state);
+    """
+    FIELDS = (
+        "id", "terminal", "url", "state", "warning", "first_seen", "last_seen",
+        "resolved_at", "last_alert", "flap_count", "problem_streak", "ok_streak"
+    )
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        rows = self.conn.execute(f"SELECT {', '.join(self.FIELDS)} FROM terminal_state").fetchall()
+        self.records = {row[0]: dict(zip(self.FIELDS, row)) for row in rows}
+        self.active = {key for key, record in self.records.items() if record["state"] != "ok"}
+
+    def _record(self, problem):
+        key = str(problem.get("id") or problem["url"].rstrip("/").rsplit("/", 1)[-1])
+        record = self.records.get(key)
+        if record is None:
+            record = dict.fromkeys(self.FIELDS)
+            record.update(id=key, state="ok", warning="", flap_count=0, problem_streak=0, ok_streak=0)
+            self.records[key] = record
+        record["terminal"] = problem["terminal"]
+        record["url"] = problem["url"]
+        record["warning"] = problem.get("warning") or record["warning"]
+        return record
+
+    def update(self, problems, now=None):
+        # Возвращает переходы [(вид, копия записи)]: new, recurring, still, resolved
+        now = now or time.time()
+        transitions = []
+        touched = []
+        dirty = []
+        with self._lock:
+            present = set()
+            for problem in problems:
+                record = self._record(problem)
+                before = (record["state"], record["last_alert"])
+                present.add(record["id"])
+                record["last_seen"] = now
+                record["ok_streak"] = 0
+                if record["state"] == "ok":
+                    record["state"] = "pending"
+                    record["problem_streak"] = 0
+                    record["first_seen"] = now
+                    self.active.add(record["id"])
+                elif record["state"] == "recovering":
+                    # Восстановление не подтвердилось - проблема продолжается без нового оповещения
+                    record["state"] = "problem"
+                record["problem_streak"] += 1
+
+                if record["state"] == "pending" and record["problem_streak"] >= CONFIG['terminal_problem_checks']:
+                    record["state"] = "problem"
+                    record["last_alert"] = now
+                    flapping = record["resolved_at"] and now - record["resolved_at"] <= CONFIG['terminal_flap_window']
+                    if flapping:
+                        record["flap_count"] += 1
+                    transitions.append(("recurring" if flapping else "new", dict(record)))
+                elif record["state"] == "problem" and now - (record["last_alert"] or now) >= CONFIG['terminal_reminder_hours'] * 3600:
+                    record["last_alert"] = now
+                    transitions.append(("still", dict(record)))
+                touched.append(record)
+                if (record["state"], record["last_alert"]) != before:
+                    dirty.append(record)
+
+            for key in self.active - present:
+                record = self.records[key]
+                before = record["state"]
+                record["ok_streak"] += 1
+                if record["state"] == "pending":
+                    # Кратковременный сбой, о котором еще не оповещали
+                    record["state"] = "ok"
+                elif record["state"] == "problem":
+                    record["state"] = "recovering"
+                if record["state"] == "recovering" and record["ok_streak"] >= CONFIG['terminal_recovery_checks']:
+                    record["state"] = "ok"
+                    record["resolved_at"] = now
+                    transitions.append(("resolved", dict(record)))
+                touched.append(record)
+                if record["state"] != before:
+                    dirty.append(record)
+
+            self.active = {record["id"] for record in touched if record["state"] != "ok"}
+            self._save(dirty)
+        return transitions
+
+    def _save(self, records):
+        if not records:
+            return
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO terminal_state ({', '.join(self.FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in self.FIELDS)})",
+                [tuple(record[field] for field in self.FIELDS) for record in records]
+            )
+
+    def migrate(self, data):
+        # Проблемы из прежнего списка last_notification_urls считаем уже оповещенными
+        with self._lock:
+            if self.records:
+                return
+            now = time.time()
+            migrated = []
+            for url in data.get("last_notification_urls", []):
+                record = self._record({"terminal": url.rstrip("/").rsplit("/", 1)[-1], "url": url})
+                record.update(state="problem", first_seen=now, last_seen=now, last_alert=now, problem_streak=1)
+                self.active.add(record["id"])
+                migrated.append(record)
+            self._save(migrated)
+
+class SessionStore:
+    # Авторизованная сессия переживает перезапуск процесса: браузер и HTTP-клиент
+    # сначала пробуют сохраненные cookie и токен, форму входа заполняют только
+    # после их истечения. Сессия привязана к логину и имеет предельный возраст
+    def __init__(self, path, max_age, login):
+        self.path = path
+        self.max_age = max_age
+        self.login = login
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Файл сессии поврежден, будет выполнен вход: {str(e)}")
+            return {}
+        if not isinstance(payload, dict) or payload.get("login") != self.login:
+            return {}
+        return payload
+
+    def load(self, kind):
+        with self._lock:
+            session = self._read().get(kind)
+        if not session or time.time() - session.get("saved_at", 0) > self.max_age:
+            return None
+        return session
+
+    def save(self, kind, session):
+        with self._lock:
+            payload = self._read()
+            payload["login"] = self.login
+            payload[kind] = dict(session, saved_at=time.time())
+            try:
+                write_json_atomic(self.path, payload, mode=0o600)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить сессию: {str(e)}")
+
+    def clear(self, kind):
+        with self._lock:
+            payload = self._read()
+            if payload.pop(kind, None) is None:
+                return
+            try:
+                write_json_atomic(self.path, payload, mode=0o600)
+            except OSError as e:
+                logger.warning(f"Не удалось очистить сессию: {str(e)}")
+
+class CountingChrome(webdriver.Chrome):
+    # Каждая команда WebDriver - отдельный HTTP-запрос к chromedriver, считаем их.
+    # account - учетная запись, под которой сейчас авторизован браузер
+    account = None
+
+    def execute(self, driver_command, params=None):
+        metrics.inc("webdriver_round_trips_total")
+        return super().execute(driver_command, params)
+
+def profile_owner_alive(profile_dir):
+    # SingletonLock - символическая ссылка "<хост>-<pid>" на процесс Chromium,
+    # который держит профиль. Процесс на другом хосте проверить нельзя - считаем живым
+    try:
+        target = os.readlink(os.path.join(profile_dir, "SingletonLock"))
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+    host, _, pid = target.rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def prepare_profile(profile_dir):
+    # Каталог профиля переживает перезапуски, чтобы бандлы SPA брались из дискового
+    # кэша. Блокировки аварийно завершенного Chromium не дают ему стартовать, их
+    # снимаем; профиль, занятый живым процессом (например, параллельным --once),
+    # не трогаем и возвращаем None - браузер запустится со временным профилем
+    os.makedirs(profile_dir, exist_ok=True)
+    if profile_owner_alive(profile_dir):
+        logger.warning(f"Профиль {profile_dir} занят другим процессом Chromium, использую временный")
+        return None
+    for name in ("SingletonLock", "SingletonSocket", "SingletonCookie"):
+        try:
+            os.remove(os.path.join(profile_dir, name))
+        except FileNotFoundError:
+            pass
+    return os.path.abspath(profile_dir)
+
+def init_browser(profile_dir=None):
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
+    options.add_argument(f"--window-size={CONFIG['browser_window_size']}")
     options.add_argument("--disable-gpu")
-    options.add_argument("--remote-debugging-port=9222")
-    
+    # Картинки не нужны для разбора: иконки оплаты и предупреждений - встроенные SVG
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    # driver.get() возвращается после DOMContentLoaded, готовность SPA проверяет open_page()
+    options.page_load_strategy = "eager"
+    if profile_dir:
+        profile_dir = prepare_profile(profile_dir)
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={profile_dir}")
+        options.add_argument(f"--disk-cache-dir={os.path.join(profile_dir, 'cache')}")
+        options.add_argument(f"--disk-cache-size={CONFIG['browser_cache_mb'] * 1024 * 1024}")
+    options.add_argument("--disable-background-networking")
+    options.add_argument("--disable-component-update")
+    options.add_argument("--disable-sync")
+    options.add_argument("--no-first-run")
+    options.add_argument("--mute-audio")
+    # Фиксированный --remote-debugging-port не задаем: chromedriver сам выбирает
+    # свободный порт, иначе несколько браузеров из пула конфликтуют между собой
+
     # Добавляем параметры для решения проблемы с DevToolsActivePort
     options.add_argument("--disable-extensions")
     options.add_argument("--disable-infobars")
@@ -79,159 +867,1257 @@ def init_browser():
     
     # Используем системный chromedriver
     service = Service(executable_path="/usr/bin/chromedriver")
-    driver = webdriver.Chrome(service=service, options=options)
-    driver.implicitly_wait(10)
+    driver = CountingChrome(service=service, options=options)
+    # Неявное ожидание отключено: каждый пустой find_elements иначе висит 10 секунд,
+    # вместо него ждем явные условия готовности через wait_for()
+    driver.implicitly_wait(0)
+    block_resources(driver)
     return driver
 
-def login(driver):
+def block_resources(driver):
+    # Шрифты, картинки, видео и счетчики аналитики отсекаются до отправки запроса.
+    # Network.setBlockedURLs не требует обработки событий перехвата на стороне Python
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": CONFIG['browser_blocked_urls']})
+    except Exception as e:
+        logger.warning(f"Не удалось включить блокировку ресурсов: {str(e)}")
+
+NAVIGATION_SCRIPT = """
+var nav = performance.getEntriesByType('navigation')[0];
+var resources = performance.getEntriesByType('resource');
+var bytes = nav ? nav.transferSize : 0;
+var cached = 0;
+for (var i = 0; i < resources.length; i++) {
+    bytes += resources[i].transferSize;
+    if (resources[i].transferSize === 0 && resources[i].decodedBodySize > 0) { cached++; }
+}
+return {
+    load: nav ? (nav.loadEventEnd || nav.domContentLoadedEventEnd) / 1000 : 0,
+    ready: performance.now() / 1000,
+    bytes: bytes,
+    resources: resources.length,
+    cached: cached
+};
+"""
+
+def record_navigation(driver, name):
+    # Время загрузки и объем переданных данных по Performance API текущей страницы
+    try:
+        stats = driver.execute_script(NAVIGATION_SCRIPT)
+    except Exception as e:
+        logger.debug(f"Не удалось получить статистику загрузки '{name}': {str(e)}")
+        return None
+    metrics.observe(f"navigation_{name}", stats["ready"])
+    metrics.inc("navigation_bytes_total", stats["bytes"])
+    metrics.inc(f"navigation_bytes_{name}", stats["bytes"])
+    logger.debug(
+        f"Страница '{name}': загрузка {stats['load']:.2f} с, готова через {stats['ready']:.2f} с, "
+        f"{stats['bytes'] / 1024:.0f} КБ, ресурсов {stats['resources']} (из кэша {stats['cached']})"
+    )
+    return stats
+
+# Учет ожиданий в текущем потоке: сколько ждали и сколько стоили бы
+# фиксированные паузы time.sleep, которые эти ожидания заменили
+wait_stats = threading.local()
+
+def reset_wait_stats():
+    wait_stats.waited = 0.0
+    wait_stats.legacy = 0.0
+
+def saved_wait_time():
+    return getattr(wait_stats, "legacy", 0.0) - getattr(wait_stats, "waited", 0.0)
+
+def wait_for(driver, name, condition, legacy_sleep=0.0):
+    # Ждем условие не дольше собственного таймаута и логируем фактическое время
+    timeout = CONFIG['wait_timeouts'][name]
+    started = time.monotonic()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=0.1).until(condition)
+        logger.debug(f"Ожидание '{name}': {time.monotonic() - started:.2f} с")
+        return result
+    except TimeoutException:
+        logger.warning(f"Ожидание '{name}' превысило {timeout} с")
+        return None
+    finally:
+        metrics.observe(f"wait_{name}", time.monotonic() - started)
+        wait_stats.waited = getattr(wait_stats, "waited", 0.0) + time.monotonic() - started
+        wait_stats.legacy = getattr(wait_stats, "legacy", 0.0) + legacy_sleep
+
+class network_idle:
+    # Условие "сеть затихла": число загруженных ресурсов не менялось quiet секунд
+    def __init__(self, quiet=0.5):
+        self.quiet = quiet
+        self.count = -1
+        self.changed_at = time.monotonic()
+
+    def __call__(self, driver):
+        state = driver.execute_script(
+            "return [document.readyState, performance.getEntriesByType('resource').length];"
+        )
+        if state[0] != "complete" or state[1] != self.count:
+            self.count = state[1]
+            self.changed_at = time.monotonic()
+            return False
+        return time.monotonic() - self.changed_at >= self.quiet
+
+def page_ready(selector):
+    # Нужный селектор отрисован и у таблиц antd нет индикатора загрузки
+    script = (
+        "return !document.querySelector('.ant-spin-spinning') "
+        "&& !!document.querySelector(arguments[0]);"
+    )
+    return lambda driver: driver.execute_script(script, selector)
+
+def login(driver, account=None):
+    # Без явной учетной записи входим под той, за которой браузер закреплен пулом
+    account = account or driver.account or accounts[0]
+    with metrics.span("login"):
+        logged_in = submit_login_form(driver, account)
+    if not logged_in:
+        metrics.inc("login_failures_total")
+    else:
+        driver.account = account
+        save_browser_session(driver, account)
+    return logged_in
+
+LOCAL_STORAGE_SCRIPT = """
+var items = {};
+for (var i = 0; i < localStorage.length; i++) {
+    var key = localStorage.key(i);
+    items[key] = localStorage.getItem(key);
+}
+return [location.origin, items];
+"""
+
+def save_browser_session(driver, account):
+    try:
+        origin, local_storage = driver.execute_script(LOCAL_STORAGE_SCRIPT)
+        account.session_store.save("browser", {
+            "cookies": driver.get_cookies(),
+            "origin": origin,
+            "local_storage": local_storage
+        })
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить сессию браузера: {str(e)}")
+
+def cdp_cookie(cookie):
+    # Формат get_cookies() -> параметры Network.setCookies (в том числе HttpOnly cookie)
+    params = {key: cookie[key] for key in ("name", "value", "domain", "path", "secure", "httpOnly") if key in cookie}
+    if cookie.get("sameSite") in ("Strict", "Lax", "None"):
+        params["sameSite"] = cookie["sameSite"]
+    if "expiry" in cookie:
+        params["expires"] = cookie["expiry"]
+    return params
+
+def restore_session(driver, account):
+    # Восстанавливаем cookie и localStorage до первой загрузки SPA и проверяем,
+    # что открылся личный кабинет, а не форма входа
+    session = account.session_store.load("browser")
+    if not session:
+        return False
+
+    with metrics.span("session_restore"):
+        script_id = None
+        try:
+            driver.execute_cdp_cmd("Network.setCookies", {
+                "cookies": [cdp_cookie(cookie) for cookie in session.get("cookies", [])]
+            })
+            if session.get("local_storage"):
+                script_id = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+                    "source": (
+                        f"if (location.origin === {json.dumps(session['origin'])}) {{"
+                        f"var items = {json.dumps(session['local_storage'])};"
+                        "for (var key in items) { localStorage.setItem(key, items[key]); }}"
+                    )
+                })["identifier"]
+            driver.get(CONFIG['login_url'])
+            wait_for(driver, "session_check", page_ready("._container_iuuwv_1, input[name='password']"))
+            valid = element_present(driver, "._container_iuuwv_1") and not login_required(driver)
+        except Exception as e:
+            logger.warning(f"Ошибка восстановления сессии: {str(e)}")
+            valid = False
+        finally:
+            # Скрипт нужен только для первой загрузки, дальше SPA сама обновляет хранилище
+            if script_id:
+                try:
+                    driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": script_id})
+                except Exception:
+                    pass
+
+    if not valid:
+        logger.info("Сохраненная сессия истекла, выполняю вход через форму")
+        metrics.inc("session_expired_total")
+        account.session_store.clear("browser")
+        return False
+    logger.info(f"Сессия браузера ({account.name}) восстановлена без входа")
+    metrics.inc("session_restores_total")
+    driver.account = account
+    record_navigation(driver, "session")
+    return True
+
+def submit_login_form(driver, account):
     try:
         driver.get(CONFIG['login_url'])
-        time.sleep(2)
         
         # Принимаем всплывающее окно
-        try:
-            accept_btn = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "button.ant-btn-primary"))
-            )
+        accept_btn = wait_for(
+            driver, "popup",
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.ant-btn-primary")),
+            legacy_sleep=2
+        )
+        if accept_btn:
             accept_btn.click()
-            time.sleep(1)
-        except Exception as e:
-            logger.warning(f"Всплывающее окно не найдено: {str(e)}")
+        else:
+            logger.warning("Всплывающее окно не найдено")
         
-        # Вводим логин и пароль
-        driver.find_element(By.CSS_SELECTOR, "input[name='login']").send_keys(CONFIG['login'])
-        time.sleep(0.5)
-        driver.find_element(By.CSS_SELECTOR, "input[name='password']").send_keys(CONFIG['password'])
-        time.sleep(0.5)
+        # Вводим логин и пароль, как только форма станет доступна
+        # (заменяет паузу после окна и две паузы по 0.5 с между полями)
+        login_input = wait_for(
+            driver, "login_form",
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "input[name='login']")),
+            legacy_sleep=2
+        )
+        if not login_input:
+            raise RuntimeError("Форма входа не загрузилась")
+        login_input.send_keys(account.login)
+        driver.find_element(By.CSS_SELECTOR, "input[name='password']").send_keys(account.password)
         driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
         
         # Проверяем успешность входа
-        WebDriverWait(driver, 10).until(
+        if not wait_for(
+            driver, "login_done",
             EC.presence_of_element_located((By.CSS_SELECTOR, "._container_iuuwv_1"))
-        )
+        ):
+            raise RuntimeError("Личный кабинет не открылся после входа")
+        record_navigation(driver, "login")
         return True
     except Exception as e:
-        logger.error(f"Ошибка авторизации: {str(e)}")
+        logger.error(f"Ошибка авторизации ({account.name}): {str(e)}")
         return False
 
-def check_sales(driver):
+def clear_session(driver):
+    # Перед сменой учетной записи браузер из пула забывает прежнюю сессию
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+    driver.account = None
+
+def element_present(driver, selector):
+    return bool(driver.find_elements(By.CSS_SELECTOR, selector))
+
+def login_required(driver):
+    return element_present(driver, "input[name='password']")
+
+def open_page(driver, url, name, ready_selector):
+    # Ждем либо содержимое страницы, либо форму входа при истекшей сессии
+    selector = f"{ready_selector}, .ant-empty, input[name='password']"
+    driver.get(url)
+    ready = wait_for(driver, name, page_ready(selector), legacy_sleep=3)
+
+    # Сессия в браузере из пула могла истечь - входим заново только в этом случае
+    if login_required(driver):
+        logger.info("Сессия истекла, выполняю повторный вход")
+        if not login(driver):
+            raise RuntimeError("Не удалось повторно авторизоваться")
+        driver.get(url)
+        ready = wait_for(driver, name, page_ready(selector), legacy_sleep=3)
+
+    # Селектор не дождались - даем SPA дозагрузить данные, пока сеть не затихнет
+    if ready is None:
+        wait_for(driver, "network_idle", network_idle())
+    record_navigation(driver, name)
+
+def browser_rss_mb(driver):
+    # Суммарный RSS chromedriver и всех дочерних процессов Chromium (Linux /proc)
     try:
-        driver.get(CONFIG['sales_url'])
-        time.sleep(3)
-        
-        rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
+        root_pid = driver.service.process.pid
+    except AttributeError:
+        return 0
+
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024)
+
+class BrowserPool:
+    # Пул авторизованных браузеров: Chromium запускается и логинится один раз,
+    # а затем переиспользуется между циклами мониторинга и командами бота.
+    # Пул общий для всех учетных записей: size ограничивает число Chromium на весь
+    # процесс, свободный браузер чужой записи переключается восстановлением сессии
+    def __init__(self, size, max_uses, max_rss_mb):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._entries = []
+        self._closed = False
+        # Chromium не разделяет каталог профиля между процессами: у каждого
+        # живого браузера свой слот, освобождаемый при его закрытии
+        self._free_profiles = list(range(size))
+
+    def _create(self, account):
+        with self._lock:
+            profile = self._free_profiles.pop(0) if self._free_profiles else None
+        try:
+            with metrics.span("browser_start"):
+                driver = init_browser(
+                    os.path.join(CONFIG['browser_profile_dir'], f"slot-{profile}")
+                    if profile is not None else None
+                )
+        except Exception:
+            self._free_profile(profile)
+            raise
+        entry = {"driver": driver, "uses": 0, "created_at": time.time(), "profile": profile}
+        with self._lock:
+            self._entries.append(entry)
+        if not (restore_session(driver, account) or login(driver, account)):
+            self._discard(entry)
+            return None
+        logger.info(f"Новый браузер добавлен в пул ({account.name})")
+        return entry
+
+    def _take_idle(self, account):
+        # Сначала браузер, уже авторизованный под этой записью, иначе последний свободный
+        with self._lock:
+            for index in range(len(self._idle) - 1, -1, -1):
+                if self._idle[index]["driver"].account is account:
+                    return self._idle.pop(index)
+            return self._idle.pop() if self._idle else None
+
+    def _switch(self, entry, account):
+        driver = entry["driver"]
+        if driver.account is account:
+            return True
+        metrics.inc("browser_account_switches_total")
+        try:
+            if driver.account is not None:
+                save_browser_session(driver, driver.account)
+            clear_session(driver)
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить сессию браузера: {str(e)}")
+            return False
+        return restore_session(driver, account) or login(driver, account)
+
+    def _free_profile(self, profile):
+        if profile is not None:
+            with self._lock:
+                self._free_profiles.append(profile)
+
+    def _discard(self, entry):
+        with self._lock:
+            if entry not in self._entries:
+                return
+            self._entries.remove(entry)
+        try:
+            entry["driver"].quit()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии браузера: {str(e)}")
+        # Слот профиля свободен только после выхода процесса Chromium
+        self._free_profile(entry["profile"])
+
+    def _healthy(self, entry):
+        try:
+            entry["driver"].execute_script("return 1")
+        except Exception as e:
+            logger.warning(f"Браузер из пула не отвечает: {str(e)}")
+            return False
+
+        if entry["uses"] >= self.max_uses:
+            logger.info(f"Браузер использован {entry['uses']} раз, перезапускаю")
+            return False
+
+        rss = browser_rss_mb(entry["driver"])
+        if rss > self.max_rss_mb:
+            logger.info(f"Браузер занимает {rss:.0f} МБ, перезапускаю")
+            return False
+        return True
+
+    def acquire(self, account):
+        if not self._slots.acquire(timeout=CONFIG['browser_acquire_timeout']):
+            logger.error("Нет свободных браузеров в пуле")
+            return None
+        try:
+            entry = None
+            while entry is None:
+                entry = self._take_idle(account)
+                if entry is None:
+                    break
+                if not self._healthy(entry) or not self._switch(entry, account):
+                    self._discard(entry)
+                    entry = None
+
+            if entry is None:
+                entry = self._create(account)
+            if entry is None:
+                self._slots.release()
+                return None
+            entry["uses"] += 1
+            return entry
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, entry, broken=False):
+        try:
+            if broken or self._closed:
+                self._discard(entry)
+            else:
+                with self._lock:
+                    self._idle.append(entry)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def session(self, account):
+        # Выдает браузер, авторизованный под account, или None, если войти не удалось
+        entry = self.acquire(account)
+        if entry is None:
+            yield None
+            return
+        broken = False
+        try:
+            yield entry["driver"]
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(entry, broken)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def rss_mb(self):
+        with self._lock:
+            drivers = [entry["driver"] for entry in self._entries]
+        return sum(browser_rss_mb(driver) for driver in drivers)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            entries = list(self._entries)
+        for entry in entries:
+            self._discard(entry)
+
+browser_pool = BrowserPool(
+    CONFIG['browser_pool_size'],
+    CONFIG['browser_max_uses'],
+    CONFIG['browser_max_rss_mb']
+)
+atexit.register(browser_pool.close)
+metrics.gauge("chromium_rss_mb", browser_pool.rss_mb)
+metrics.gauge("browser_pool_browsers", browser_pool.size)
+
+# Уникальные фрагменты атрибута "d" у SVG-иконок способов оплаты
+PAYMENT_SIGNATURES = [
+    ("v8c0 6.6-5.4 12-12 12", "💳 Карта"),  # Банковская карта
+    ("c-53.02 0-96 50.14-96 112", "💵 Купюры"),  # Купюры
+    ("c-48.6 0-92.6 9-124.5 23.4", "🪙 Монеты")  # Монеты
+]
+
+# Разбор всей таблицы продаж внутри страницы за один вызов WebDriver
+# вместо отдельного запроса на каждую строку, ячейку, иконку и path
+SALES_TABLE_SCRIPT = """
+var signatures = arguments[0];
+var unknown = arguments[1];
+var rows = document.querySelectorAll("table tbody tr");
+var sales = [];
+for (var i = 0; i < rows.length; i++) {
+    var cols = rows[i].querySelectorAll("td");
+    if (cols.length < 5) {
+        continue;
+    }
+    var payment = unknown;
+    var icons = cols.length > 5 ? cols[5].querySelectorAll("svg") : [];
+    for (var j = 0; j < icons.length; j++) {
+        var paths = icons[j].querySelectorAll("path");
+        var matched = false;
+        for (var k = 0; k < paths.length && !matched; k++) {
+            var d = paths[k].getAttribute("d");
+            for (var n = 0; d && n < signatures.length; n++) {
+                if (d.indexOf(signatures[n][0]) !== -1) {
+                    payment = signatures[n][1];
+                    matched = true;
+                    break;
+                }
+            }
+        }
+    }
+    sales.push({
+        number: cols[0].innerText.trim(),
+        address: cols[1].innerText.trim(),
+        time: cols[2].innerText.trim(),
+        liters: cols[3].innerText.trim(),
+        total: cols[4].innerText.trim(),
+        payment: payment
+    });
+}
+return sales;
+"""
+
+def extract_sales(driver):
+    return driver.execute_script(SALES_TABLE_SCRIPT, PAYMENT_SIGNATURES, "Не указано") or []
+
+def fetch_sales(driver):
+    # Первая страница продаж; ошибки пробрасываются, чтобы неудачная проверка
+    # не выглядела как пустой список и не попадала в кэш результатов
+    open_page(driver, CONFIG['sales_url'], "sales_table", "table tbody tr")
+    return extract_sales(driver)
+
+def next_page(driver, name, marker_selector, marker):
+    # Переход на следующую страницу пагинации antd. Строки могут переиспользоваться,
+    # поэтому ждем, пока текст первого элемента marker_selector сменится
+    buttons = driver.find_elements(
+        By.CSS_SELECTOR, "li.ant-pagination-next:not(.ant-pagination-disabled) button"
+    )
+    if not buttons:
+        return False
+    buttons[0].click()
+
+    script = (
+        "var first = document.querySelector(arguments[0]);"
+        "return !document.querySelector('.ant-spin-spinning') "
+        "&& !!first && first.innerText.trim() !== arguments[1];"
+    )
+    if not wait_for(driver, name, lambda d: d.execute_script(script, marker_selector, marker)):
+        raise RuntimeError("Следующая страница не загрузилась")
+    return True
+
+def iter_sales_pages(driver, max_pages):
+    # Страницы продаж от новых к старым; ошибки пробрасываются вызывающему
+    open_page(driver, CONFIG['sales_url'], "sales_table", "table tbody tr")
+    for page in range(max_pages):
+        sales = extract_sales(driver)
+        yield sales
+        if not sales or page + 1 >= max_pages or not next_page(driver, "sales_table", "table tbody tr td", sales[0]["number"]):
+            return
+
+# Иконки, которыми SPA помечает аппарат с проблемой
+PROBLEM_ICONS = ["exclamation-circle"]
+
+# Разбор списка аппаратов за один проход внутри страницы: для каждой ссылки на
+# аппарат ищем иконку проблемы в ее родительском элементе
+TERMINALS_SCRIPT = """
+var selector = arguments[0].map(function (icon) {
+    return "svg[data-icon='" + icon + "']";
+}).join(", ");
+var links = document.querySelectorAll("a[href^='/terminal/']");
+var terminals = [];
+for (var i = 0; i < links.length; i++) {
+    var parent = links[i].parentElement;
+    var icon = parent ? parent.querySelector(selector) : null;
+    terminals.push({
+        id: links[i].getAttribute("href").split("/terminal/")[1].split(/[/?#]/)[0],
+        terminal: links[i].innerText.trim(),
+        url: links[i].href,
+        status: icon ? "problem" : "ok",
+        warning: icon ? icon.getAttribute("data-icon") : ""
+    });
+}
+return terminals;
+"""
+
+def extract_terminals(driver):
+    return driver.execute_script(TERMINALS_SCRIPT, PROBLEM_ICONS) or []
+
+def scan_terminals(driver):
+    # Все аппараты со всех страниц списка; ошибки пробрасываются вызывающему
+    open_page(driver, CONFIG['terminals_url'], "terminals_list", "a[href^='/terminal/']")
+    terminals = []
+    for page in range(CONFIG['terminals_max_pages']):
+        batch = extract_terminals(driver)
+        terminals.extend(batch)
+        if not batch or page + 1 >= CONFIG['terminals_max_pages']:
+            break
+        if not next_page(driver, "terminals_list", "a[href^='/terminal/']", batch[0]["terminal"]):
+            break
+    return terminals
+
+# Способы оплаты в ответах API приводим к тем же подписям, что и при разборе SVG
+API_PAYMENT_LABELS = {
+    "card": "💳 Карта",
+    "cashless": "💳 Карта",
+    "bill": "💵 Купюры",
+    "bills": "💵 Купюры",
+    "banknote": "💵 Купюры",
+    "cash": "💵 Купюры",
+    "coin": "🪙 Монеты",
+    "coins": "🪙 Монеты"
+}
+
+def pick(item, *keys, default=""):
+    # Первое непустое значение по списку ключей, вложенные поля через точку
+    for key in keys:
+        value = item
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value not in (None, ""):
+            return value
+    return default
+
+def api_items(payload):
+    # Список записей может прийти как массив или как объект с пагинацией
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for key in ("items", "data", "results", "rows"):
+            if isinstance(payload.get(key), list):
+                return payload[key]
+    return []
+
+def api_time(value):
+    # ISO-время из API переводим в московское "ЧЧ:ММ:СС", как в таблице продаж
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return str(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset() + timedelta(hours=3)
+    return parsed.strftime("%H:%M:%S")
+
+# Keep-alive соединения с API общие для всех учетных записей
+http_pool = urllib3.PoolManager(
+    maxsize=CONFIG['http_pool_size'],
+    timeout=urllib3.Timeout(total=CONFIG['http_timeout']),
+    # Повторяем только идемпотентные запросы: POST входа не должен уйти дважды
+    retries=urllib3.Retry(total=2, backoff_factor=0.5, allowed_methods=frozenset({"GET", "HEAD"}))
+)
+
+class HttpPortalClient:
+    # Прямой доступ к JSON API, которое вызывает SPA: один вход, токен и cookie
+    # хранятся между запросами, соединения переиспользуются через keep-alive пул
+    def __init__(self, account):
+        self.account = account
+        self.http = http_pool
+        self.token = None
+        self.cookies = {}
+        # Токен взят из файла сессии и еще не подтвержден запросом к API
+        self.restored = False
+        # Номер текущей авторизации: параллельные задачи, получившие 401 на одном
+        # и том же токене, входят заново только один раз
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def _headers(self):
+        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        return headers
+
+    def _store_cookies(self, response):
+        for header in response.headers.getlist("Set-Cookie"):
+            name, _, rest = header.partition("=")
+            self.cookies[name.strip()] = rest.split(";", 1)[0]
+
+    def login(self):
+        with self._lock:
+            return self._login()
+
+    def _login(self):
+        # Вызывается под self._lock
+        self.token = None
+        self.cookies = {}
+        self.restored = False
+        response = self.http.request(
+            "POST",
+            CONFIG['api_url'] + CONFIG['api_login_path'],
+            body=json.dumps({"login": self.account.login, "password": self.account.password}),
+            headers=self._headers()
+        )
+        if response.status >= 400:
+            logger.error(f"Ошибка авторизации API ({self.account.name}): HTTP {response.status}")
+            metrics.inc("login_failures_total")
+            return False
+        self._store_cookies(response)
+        try:
+            payload = json.loads(response.data or b"{}")
+        except ValueError:
+            payload = {}
+        if isinstance(payload, dict):
+            self.token = pick(payload, "token", "accessToken", "access_token",
+                              "data.token", "data.accessToken", default=None)
+        if not (self.token or self.cookies):
+            return False
+        self.generation += 1
+        self.account.session_store.save("http", {"token": self.token, "cookies": self.cookies})
+        return True
+
+    def restore(self):
+        # Сохраненный токен проверяется первым же запросом: при 401 get_json()
+        # очищает его и выполняет обычный вход
+        session = self.account.session_store.load("http")
+        if not session:
+            return False
+        with self._lock:
+            self.token = session.get("token")
+            self.cookies = dict(session.get("cookies") or {})
+            self.restored = True
+            self.generation += 1
+            return bool(self.token or self.cookies)
+
+    def ensure_login(self):
+        with self._lock:
+            authorized = bool(self.token or self.cookies)
+        try:
+            return authorized or self.restore() or self.login()
+        except Exception as e:
+            logger.error(f"Ошибка авторизации API: {str(e)}")
+            return False
+
+    def _auth(self):
+        # Снимок заголовков и номера авторизации, пока login() не меняет их
+        with self._lock:
+            return self._headers(), self.generation
+
+    def _relogin(self, generation):
+        with self._lock:
+            # Другая задача уже вошла заново, пока этот запрос получал 401
+            if self.generation != generation:
+                return True
+            logger.info("Сессия API истекла, выполняю повторный вход")
+            if self.restored:
+                metrics.inc("session_expired_total")
+                self.account.session_store.clear("http")
+            return self._login()
+
+    def get_json(self, path, fields=None):
+        url = CONFIG['api_url'] + path
+        headers, generation = self._auth()
+        response = self.http.request("GET", url, fields=fields, headers=headers)
+        # Токен истек - входим заново один раз и повторяем запрос
+        if response.status in (401, 403):
+            if not self._relogin(generation):
+                raise RuntimeError("Не удалось повторно авторизоваться в API")
+            headers, generation = self._auth()
+            response = self.http.request("GET", url, fields=fields, headers=headers)
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} для {path}")
+        with self._lock:
+            if self.restored:
+                self.restored = False
+                logger.info("Сессия API восстановлена без входа")
+                metrics.inc("session_restores_total")
+            self._store_cookies(response)
+        return json.loads(response.data)
+
+    def fetch_sales_page(self, page):
+        payload = self.get_json(CONFIG['api_sales_path'], {"page": page})
         sales = []
-        for row in rows:
-            cols = row.find_elements(By.TAG_NAME, "td")
-            if len(cols) >= 5:
-                # Определяем способ оплаты по содержимому SVG
-                payment_method = "Не указано"
-                payment_icons = cols[5].find_elements(By.TAG_NAME, "svg")
-                
-                for icon in payment_icons:
-                    # Получаем содержимое элемента path
-                    paths = icon.find_elements(By.TAG_NAME, "path")
-                    for path in paths:
-                        d_attr = path.get_attribute("d")
-                        
-                        # Определяем по уникальным частям пути
-                        if d_attr:
-                            # Банковская карта
-                            if "v8c0 6.6-5.4 12-12 12" in d_attr:
-                                payment_method = "💳 Карта"
-                                break
-                                
-                            # Купюры
-                            elif "c-53.02 0-96 50.14-96 112" in d_attr:
-                                payment_method = "💵 Купюры"
-                                break
-                                
-                            # Монеты
-                            elif "c-48.6 0-92.6 9-124.5 23.4" in d_attr:
-                                payment_method = "🪙 Монеты"
-                                break
-                
-                sales.append({
-                    "number": cols[0].text,
-                    "address": cols[1].text,
-                    "time": cols[2].text,
-                    "liters": cols[3].text,
-                    "total": cols[4].text,
-                    "payment": payment_method
-                })
+        for item in api_items(payload):
+            payment = str(pick(item, "payment", "paymentMethod", "payment_method", "paymentType")).lower()
+            sales.append({
+                "number": str(pick(item, "number", "id")),
+                "address": str(pick(item, "address", "terminal.address", "terminal.name")),
+                "time": api_time(pick(item, "time", "createdAt", "created_at", "date")),
+                "liters": str(pick(item, "liters", "volume")),
+                "total": str(pick(item, "total", "amount", "sum")),
+                "payment": API_PAYMENT_LABELS.get(payment, "Не указано")
+            })
         return sales
-    except Exception as e:
-        logger.error(f"Ошибка при проверке продаж: {str(e)}")
-        return []
 
-def check_terminals(driver):
+    def fetch_sales(self):
+        return self.fetch_sales_page(1)
+
+    def iter_sales_pages(self, max_pages):
+        for page in range(1, max_pages + 1):
+            sales = self.fetch_sales_page(page)
+            yield sales
+            if not sales:
+                return
+
+    def scan_terminals(self):
+        terminals = {}
+        for page in range(1, CONFIG['terminals_max_pages'] + 1):
+            items = api_items(self.get_json(CONFIG['api_terminals_path'], {"page": page}))
+            fresh = 0
+            for item in items:
+                terminal_id = str(pick(item, "id", "number"))
+                if terminal_id in terminals:
+                    continue
+                fresh += 1
+                warnings = pick(item, "warnings", "errors", "alerts", default=[])
+                status = str(pick(item, "status", "state", default="ok")).lower()
+                problem = bool(warnings) or status not in ("ok", "online", "active", "normal")
+                warning = warnings[0] if isinstance(warnings, list) and warnings else warnings
+                if isinstance(warning, dict):
+                    warning = pick(warning, "type", "code", "message")
+                terminals[terminal_id] = {
+                    "id": terminal_id,
+                    "terminal": str(pick(item, "name", "address", "id")),
+                    "url": f"{CONFIG['login_url']}/terminal/{terminal_id}",
+                    "status": "problem" if problem else "ok",
+                    "warning": str(warning or (status if problem else ""))
+                }
+            # API без пагинации вернет ту же страницу повторно - дальше не листаем
+            if not fresh:
+                break
+        return list(terminals.values())
+
+class BrowserSource:
+    # Обертка над браузером с тем же интерфейсом, что и у HttpPortalClient
+    def __init__(self, driver):
+        self.driver = driver
+
+    def fetch_sales(self):
+        return fetch_sales(self.driver)
+
+    def iter_sales_pages(self, max_pages):
+        return iter_sales_pages(self.driver, max_pages)
+
+    def scan_terminals(self):
+        return scan_terminals(self.driver)
+
+class Account:
+    # Учетная запись дилера: свои логин, администраторы, расписание и каталог
+    # состояния (data.json, история, сессия). Браузеры, HTTP-соединения и потоки
+    # проверок общие для всех записей
+    def __init__(self, name, login, password, admin_ids, state_dir="", title=None,
+                 sales_interval=None, terminals_interval=None):
+        self.name = name
+        self.title = title or name
+        self.login = login
+        self.password = password
+        self.admin_ids = list(admin_ids)
+        self.sales_interval = dict(CONFIG['sales_interval'], **(sales_interval or {}))
+        self.terminals_interval = dict(CONFIG['terminals_interval'], **(terminals_interval or {}))
+        # Сглаженный поток продаж (продаж в минуту) между успешными проверками
+        self.sales_rate = {"per_minute": 0.0, "measured_at": None}
+
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+        def path(filename):
+            return os.path.join(state_dir, os.path.basename(filename)) if state_dir else filename
+
+        self.state = StateStore(path(CONFIG['data_file']), CONFIG['state_journal'], CONFIG['state_compact_entries'])
+        self.history = SalesHistory(path(CONFIG['history_db']))
+        self.terminal_tracker = TerminalTracker(path(CONFIG['history_db']))
+        self.session_store = SessionStore(path(CONFIG['session_file']), CONFIG['session_max_age'], login)
+        self.http = HttpPortalClient(self)
+        atexit.register(self.state.close)
+
+    def is_admin(self, user_id):
+        return user_id in self.admin_ids
+
+def load_accounts():
+    # Список учетных записей из ACCOUNTS (JSON) или файла ACCOUNTS_FILE:
+    # [{"name": "north", "login": "...", "password_env": "NORTH_PASSWORD",
+    #   "admin_ids": [123], "sales_interval": {"max": 600}}, ...]
+    raw = CONFIG['accounts']
+    source = "ACCOUNTS"
+    if not raw and os.path.exists(CONFIG['accounts_file']):
+        source = CONFIG['accounts_file']
+        with open(CONFIG['accounts_file']) as f:
+            raw = f.read()
+    if not raw:
+        # Прежний режим: одна запись из LOGIN/PASSWORD, состояние в текущем каталоге
+        return [Account("default", CONFIG['login'], CONFIG['password'], CONFIG['telegram_admin_ids'])]
+
     try:
-        driver.get(CONFIG['terminals_url'])
-        time.sleep(3)
-        
-        warnings = driver.find_elements(By.CSS_SELECTOR, "svg[data-icon='exclamation-circle']")
-        if not warnings:
+        items = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"Некорректный JSON учетных записей в {source}: {str(e)}")
+    loaded = []
+    for item in items:
+        name = str(item.get("name", ""))
+        if not name or not all(ch.isalnum() or ch in "-_" for ch in name):
+            raise ValueError(f"Некорректное имя учетной записи в {source}: {name!r}")
+        if name in (account.name for account in loaded):
+            raise ValueError(f"Учетная запись {name} указана в {source} дважды")
+        password = item.get("password") or os.getenv(item.get("password_env", ""), "")
+        if not item.get("login") or not password:
+            raise ValueError(f"Для учетной записи {name} не заданы логин или пароль")
+        loaded.append(Account(
+            name,
+            item["login"],
+            password,
+            item.get("admin_ids", CONFIG['telegram_admin_ids']),
+            state_dir=item.get("state_dir", os.path.join(CONFIG['accounts_dir'], name)),
+            title=item.get("title"),
+            sales_interval=item.get("sales_interval"),
+            terminals_interval=item.get("terminals_interval")
+        ))
+    if not loaded:
+        raise ValueError(f"В {source} нет ни одной учетной записи")
+    return loaded
+
+accounts = load_accounts()
+
+def find_accounts(user_id, names=()):
+    # Записи, которые администрирует пользователь, с фильтром по именам из аргументов команды
+    allowed = [account for account in accounts if account.is_admin(user_id)]
+    wanted = {name.lower() for name in names}
+    selected = [account for account in allowed if account.name.lower() in wanted]
+    return selected or allowed
+
+@contextmanager
+def portal_session(account):
+    # Выдает источник данных согласно CONFIG['backend'] или None при ошибке входа
+    if CONFIG['backend'] == "http":
+        yield account.http if account.http.ensure_login() else None
+        return
+    with browser_pool.session(account) as driver:
+        yield BrowserSource(driver) if driver else None
+
+class JobRunner:
+    # Ограниченный пул для задач проверки портала. Одинаковые задачи, которые уже
+    # выполняются, не запускаются повторно: все запросившие получают общий Future
+    def __init__(self, max_workers, limits):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+        self.limits = {job_type: threading.BoundedSemaphore(n) for job_type, n in limits.items()}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_type, key, func, *args):
+        with self._lock:
+            future = self._inflight.get((job_type, key))
+            if future is not None and not future.done():
+                return future
+            future = self.executor.submit(self._run, job_type, func, *args)
+            self._inflight[(job_type, key)] = future
+        # Колбэк вешаем вне блокировки: у быстрой задачи он выполнится сразу
+        future.add_done_callback(lambda f: self._forget(job_type, key, f))
+        return future
+
+    def _forget(self, job_type, key, future):
+        with self._lock:
+            if self._inflight.get((job_type, key)) is future:
+                del self._inflight[(job_type, key)]
+
+    def _run(self, job_type, func, *args):
+        with self.limits[job_type]:
+            return func(*args)
+
+jobs = JobRunner(CONFIG['scrape_workers'], CONFIG['job_limits'])
+
+class ResultCache:
+    # Последние результаты fetch_sales()/scan_terminals() от планировщика и команд
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def get(self, key):
+        # (значение, возраст в секундах) или (None, None), если данных нет
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        return entry[0], time.monotonic() - entry[1]
+
+result_cache = ResultCache()
+
+def fetch_cached(account, job_type, job, force=False):
+    # Future с (результат, возраст). Свежий кэш отдается сразу; устаревший тоже
+    # отдается сразу, но запускает фоновое обновление (stale-while-revalidate)
+    value, age = result_cache.get((account.name, job_type))
+    key = f"{account.name}:refresh"
+    if not force and value is not None and age <= CONFIG['cache_max_stale']:
+        if age > CONFIG['cache_ttl'][job_type]:
+            jobs.submit(job_type, key, job, account)
+        future = Future()
+        future.set_result((value, age))
+        return future
+
+    result = Future()
+
+    def done(refresh):
+        try:
+            result.set_result((refresh.result(), 0))
+        except Exception as e:
+            result.set_exception(e)
+
+    jobs.submit(job_type, key, job, account).add_done_callback(done)
+    return result
+
+def format_age(age):
+    if age < 5:
+        return "только что"
+    if age < 120:
+        return f"{age:.0f} с назад"
+    return f"{age / 60:.0f} мин назад"
+
+MAX_MESSAGE_LENGTH = 4096  # Максимальная длина сообщения в Telegram
+MESSAGE_SEPARATOR = "────────────────────\n"
+
+def split_message(message):
+    # Если сообщение слишком длинное, разбиваем его на части по разделителям
+    if len(message) <= MAX_MESSAGE_LENGTH:
+        return [message]
+
+    chunks = []
+    current_part = ""
+    for part in message.split(MESSAGE_SEPARATOR):
+        if len(current_part) + len(part) + 100 > MAX_MESSAGE_LENGTH and current_part:
+            chunks.append(current_part)
+            current_part = ""
+        current_part += part + MESSAGE_SEPARATOR
+    if current_part:
+        chunks.append(current_part)
+    return chunks
+
+class TokenBucket:
+    # Ограничитель частоты: rate сообщений в секунду, не больше capacity подряд
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def block(self, seconds):
+        # Telegram вернул 429: не отправляем до истечения retry_after
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class TelegramOutbox:
+    # Постоянная очередь исходящих сообщений: переживает перезапуск процесса
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS outbox_chat ON outbox (chat_id, next_attempt);
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def put(self, chat_id, kind, texts):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (chat_id, kind, text, next_attempt) VALUES (?, ?, ?, ?)",
+                [(chat_id, kind, text, time.time()) for text in texts]
+            )
+
+    def due_chats(self):
+        # Чат готов, только когда пора отправлять его первое сообщение: иначе
+        # take() вернет пустой список и доставка будет крутиться вхолостую
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT chat_id FROM outbox WHERE id IN "
+                "(SELECT MIN(id) FROM outbox GROUP BY chat_id) AND next_attempt <= ?",
+                (time.time(),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def take(self, chat_id, limit=50):
+        # Сообщения чата по порядку постановки, если первое из них уже пора отправлять
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, kind, text, attempts, next_attempt FROM outbox "
+                "WHERE chat_id = ? ORDER BY id LIMIT ?", (chat_id, limit)
+            ).fetchall()
+        if not rows or rows[0][4] > time.time():
             return []
-        
-        problems = []
-        terminal_links = driver.find_elements(By.CSS_SELECTOR, "a[href^='/terminal/']")
-        for link in terminal_links:
-            parent_html = link.find_element(By.XPATH, "./..").get_attribute("innerHTML")
-            if any(warning.get_attribute("outerHTML") in parent_html for warning in warnings):
-                problems.append({
-                    "terminal": link.text,
-                    "url": link.get_attribute("href")
-                })
-        return problems
-    except Exception as e:
-        logger.error(f"Ошибка при проверке аппаратов: {str(e)}")
-        return []
+        return rows
 
-def send_telegram_notification(message):
-    MAX_MESSAGE_LENGTH = 4096  # Максимальная длина сообщения в Telegram
-    
-    for chat_id in CONFIG['telegram_admin_ids']:
+    def done(self, ids):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, ids, delay, count_attempt=True):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE outbox SET attempts = attempts + ?, next_attempt = ? WHERE id = ?",
+                [(1 if count_attempt else 0, time.time() + delay, i) for i in ids]
+            )
+
+    def depth(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+class TelegramDelivery:
+    # Фоновая доставка: чаты обслуживаются параллельно, порядок внутри чата
+    # сохраняется, частота ограничена общим и поканальными token bucket
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.global_bucket = TokenBucket(CONFIG['telegram_global_rate'], CONFIG['telegram_global_rate'])
+        self.chat_buckets = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=CONFIG['telegram_workers'], thread_name_prefix="telegram"
+        )
+        self.stats = {"sent": 0, "failed": 0, "retry_after": 0, "coalesced": 0}
+        self._sent_times = deque()
+        self._busy = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-delivery", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, chat_id, message, kind):
+        self.outbox.put(chat_id, kind, split_message(message))
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                for chat_id in self.outbox.due_chats():
+                    with self._lock:
+                        if chat_id in self._busy:
+                            continue
+                        self._busy.add(chat_id)
+                    self.executor.submit(self._deliver_chat, chat_id)
+            except Exception as e:
+                logger.error(f"Ошибка очереди Telegram: {str(e)}")
+
+    def _coalesce(self, rows):
+        # Подряд идущие сообщения о продажах склеиваем в одно, пока влезает в лимит
+        ids = [rows[0][0]]
+        text = rows[0][2]
+        if rows[0][1] == "sales":
+            for row_id, kind, row_text, _, _ in rows[1:]:
+                if kind != "sales" or len(text) + len(row_text) + 1 > MAX_MESSAGE_LENGTH:
+                    break
+                ids.append(row_id)
+                text += "\n" + row_text
+        return ids, text, rows[0][3]
+
+    def _deliver_chat(self, chat_id):
+        bucket = self.chat_buckets.setdefault(
+            chat_id, TokenBucket(CONFIG['telegram_chat_rate'], 1)
+        )
         try:
-            # Если сообщение слишком длинное, разбиваем его на части
-            if len(message) > MAX_MESSAGE_LENGTH:
-                # Разбиваем сообщение по разделителям
-                parts = message.split("────────────────────\n")
-                current_part = ""
-                
-                for part in parts:
-                    if len(current_part) + len(part) + 100 > MAX_MESSAGE_LENGTH and current_part:
-                        # Отправляем текущую часть
+            while True:
+                rows = self.outbox.take(chat_id)
+                if not rows:
+                    return
+                ids, text, attempts = self._coalesce(rows)
+                bucket.acquire()
+                self.global_bucket.acquire()
+                try:
+                    with metrics.span("telegram_send"):
                         bot.send_message(
                             chat_id=chat_id,
-                            text=current_part,
+                            text=text,
                             parse_mode="HTML",
                             disable_web_page_preview=True
                         )
-                        current_part = ""
-                        time.sleep(1)  # Задержка между сообщениями
-                    
-                    current_part += part + "────────────────────\n"
-                
-                # Отправляем оставшуюся часть
-                if current_part:
-                    bot.send_message(
-                        chat_id=chat_id,
-                        text=current_part,
-                        parse_mode="HTML",
-                        disable_web_page_preview=True
-                    )
-            else:
-                # Отправляем сообщение целиком
-                bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    parse_mode="HTML",
-                    disable_web_page_preview=True
-                )
-            
-            logger.info(f"Сообщение отправлено в Telegram: {chat_id}")
+                except RetryAfter as e:
+                    logger.warning(f"Telegram ограничил частоту для {chat_id}, пауза {e.retry_after} с")
+                    metrics.inc("telegram_retry_after_total")
+                    with self._lock:
+                        self.stats["retry_after"] += 1
+                    bucket.block(e.retry_after)
+                    self.outbox.retry(ids, e.retry_after, count_attempt=False)
+                    return
+                except Exception as e:
+                    if attempts + 1 >= CONFIG['telegram_max_attempts']:
+                        logger.error(f"Сообщение для {chat_id} не доставлено, удаляю из очереди: {e}")
+                        metrics.inc("alerts_failed_total", len(ids))
+                        with self._lock:
+                            self.stats["failed"] += len(ids)
+                        self.outbox.done(ids)
+                    else:
+                        logger.error(f"Ошибка отправки в Telegram: {e}")
+                        self.outbox.retry(ids, min(2 ** attempts, 300))
+                    return
+
+                self.outbox.done(ids)
+                metrics.inc("alerts_sent_total")
+                with self._lock:
+                    self.stats["sent"] += 1
+                    self.stats["coalesced"] += len(ids) - 1
+                    self._sent_times.append(time.monotonic())
+                logger.info(f"Сообщение отправлено в Telegram: {chat_id}")
         except Exception as e:
-            logger.error(f"Ошибка отправки в Telegram: {e}")
+            logger.error(f"Ошибка доставки в Telegram: {str(e)}")
+        finally:
+            with self._lock:
+                self._busy.discard(chat_id)
+            self._wakeup.set()
+
+    def drain(self, timeout):
+        # Ждем опустошения очереди (используется перед выходом в режиме --once)
+        self.start()
+        deadline = time.monotonic() + timeout
+        while self.outbox.depth() and time.monotonic() < deadline:
+            self._wakeup.set()
+            time.sleep(0.2)
+
+    def stats_snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._sent_times and now - self._sent_times[0] > 60:
+                self._sent_times.popleft()
+            stats = dict(self.stats)
+            stats["sent_last_minute"] = len(self._sent_times)
+        stats["queue_depth"] = self.outbox.depth()
+        return stats
+
+delivery = TelegramDelivery(TelegramOutbox(CONFIG['history_db']))
+metrics.gauge("telegram_queue_depth", delivery.outbox.depth)
+
+def account_header(account):
+    # При нескольких учетных записях сообщения подписываются названием записи
+    return f"🏷 <b>{account.title}</b>\n" if len(accounts) > 1 else ""
+
+def send_telegram_notification(message, kind="info", account=None):
+    # Сообщение ставится в очередь и доставляется фоновым потоком администраторам
+    # учетной записи; без записи - администраторам всех записей
+    if account is None:
+        chat_ids = dict.fromkeys(chat_id for item in accounts for chat_id in item.admin_ids)
+    else:
+        chat_ids = account.admin_ids
+        message = account_header(account) + message
+    for chat_id in chat_ids:
+        delivery.enqueue(chat_id, message, kind)
 
 def format_sales(sales):
     if not sales:
@@ -275,12 +2161,61 @@ def format_problems(problems):
     message += f"\nВсего проблемных аппаратов: <b>{len(problems)}</b>"
     return message
 
+def format_duration(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
+
+def format_transitions(transitions):
+    now = time.time()
+    message = "⚠️ <b>СОСТОЯНИЕ АППАРАТОВ</b> ⚠️\n\n"
+    for kind, record in transitions:
+        warning = f" ({record['warning']})" if record['warning'] else ""
+        if kind == "new":
+            title = f"🔴 <b>Новая проблема{warning}</b>"
+        elif kind == "recurring":
+            title = f"🔁 <b>Проблема повторилась{warning}</b>, сбоев подряд: {record['flap_count']}"
+        elif kind == "still":
+            title = f"⏳ <b>Не работает уже {format_duration(now - record['first_seen'])}</b>{warning}"
+        else:
+            title = f"🟢 <b>Снова в норме</b>, простой {format_duration(record['resolved_at'] - record['first_seen'])}"
+        message += (
+            f"{title}\n"
+            f"🏷 <b>Аппарат:</b> {record['terminal']}\n"
+            f"🔗 <b>Ссылка:</b> {record['url']}\n"
+            f"────────────────────\n"
+        )
+    return message
+
+def format_report(account, day):
+    history = account.history
+    totals = history.totals_by_terminal_day(day, day)
+    if not totals:
+        return f"📊 Нет продаж за {day.strftime('%d.%m.%Y')}"
+
+    message = f"📊 <b>ОТЧЕТ ЗА {day.strftime('%d.%m.%Y')}</b> 📊\n\n"
+    for _, address, count, liters, revenue in totals:
+        message += (
+            f"📍 <b>{address}</b>\n"
+            f"🧾 Продаж: {count} | 💧 {liters:g} л | 💸 {revenue:g} руб.\n"
+            f"────────────────────\n"
+        )
+
+    message += f"\n💧 <b>Всего литров:</b> {history.liters_sold(day, day):g}\n"
+    message += f"💸 <b>Выручка:</b> {sum(row[4] for row in totals):g} руб.\n\n"
+    message += "<b>Способы оплаты:</b>\n"
+    for payment, count, revenue in history.payment_mix(day, day):
+        message += f"{payment}: {count} шт. на {revenue:g} руб.\n"
+    return message
+
 def start(update, context):
     menu_text = (
         "🚰 <b>Бот мониторинга AliveWater</b> 🚰\n\n"
         "Выберите действие:\n\n"
         "💳 /check_sales - Проверить продажи\n"
         "⚠️ /check_terminals - Проверить состояние аппаратов\n"
+        "📊 /report - Отчет о продажах за сегодня\n"
         "ℹ️ /status - Статус системы\n"
         "🆘 /help - Помощь"
     )
@@ -292,145 +2227,479 @@ def help_command(update, context):
         "Этот бот автоматически отслеживает:\n"
         "- Новые продажи воды 💧\n"
         "- Проблемы с аппаратами ⚠️\n\n"
-        "Автоматическая проверка происходит каждые 5 минут\n\n"
+        "Продажи проверяются от 1 до 5 минут в зависимости от их частоты, "
+        "аппараты - каждые 5 минут, ночью реже\n\n"
         "<b>Доступные команды:</b>\n"
         "💳 /check_sales - Показать последние продажи\n"
         "⚠️ /check_terminals - Проверить состояние аппаратов\n"
+        "🔄 Добавьте force, чтобы не брать данные из кэша: /check_sales force\n"
+        "🏷 Если у вас несколько учетных записей, укажите имя: /check_sales north\n"
+        "📊 /report - Отчет о продажах за сегодня (или /report вчера)\n"
         "ℹ️ /status - Статус системы\n"
         "🆘 /help - Помощь"
     )
     update.message.reply_text(help_text, parse_mode="HTML")
 
-def check_sales_command(update, context):
-    if update.message.from_user.id not in CONFIG['telegram_admin_ids']:
+def sales_job(account):
+    with portal_session(account) as source:
+        if not source:
+            return None
+        with metrics.span("check_sales"):
+            sales = source.fetch_sales()
+        account.history.add_sales(sales)
+        account.history.flush()
+        result_cache.put((account.name, "sales"), sales)
+        return sales
+
+def terminals_job(account):
+    with portal_session(account) as source:
+        if not source:
+            return None
+        with metrics.span("check_terminals"):
+            terminals = source.scan_terminals()
+        problems = [t for t in terminals if t["status"] == "problem"]
+        # В историю пишем и исправные аппараты, иначе по ней не видно восстановлений
+        account.history.add_terminal_statuses(terminals)
+        account.history.flush()
+        process_terminals(account, problems)
+        result_cache.put((account.name, "terminals"), problems)
+        return problems
+
+def reply_when_done(update, future, name, on_result, header=""):
+    # Ответ отправляется, когда проверка завершится (или сразу, если данные из кэша)
+    def callback(done):
+        try:
+            result, age = done.result()
+            if result is None:
+                update.message.reply_text(f"{header}🔐 Ошибка авторизации", parse_mode="HTML")
+            else:
+                on_result(result, age)
+        except Exception as e:
+            update.message.reply_text(f"{header}❌ Ошибка: {str(e)}", parse_mode="HTML")
+            logger.error(f"Ошибка в {name}: {str(e)}")
+    future.add_done_callback(callback)
+
+def force_requested(context):
+    return any(arg.lower() in ("force", "обновить") for arg in context.args or [])
+
+def command_accounts(update, context):
+    # Учетные записи, доступные автору команды; пустой список - доступ запрещен
+    selected = find_accounts(update.message.from_user.id, context.args or [])
+    if not selected:
         update.message.reply_text("⛔ Доступ запрещен")
+    return selected
+
+def check_sales_command(update, context):
+    selected = command_accounts(update, context)
+    if not selected:
         return
     
     update.message.reply_text("🔍 Проверяю продажи...")
-    try:
-        driver = init_browser()
-        if login(driver):
-            sales = check_sales(driver)
-            
+
+    for account in selected:
+        def on_result(sales, age, account=account):
+            header = account_header(account)
             if not sales:
-                update.message.reply_text("🛍️ Нет данных о продажах", parse_mode="HTML")
+                update.message.reply_text(f"{header}🛍️ Нет данных о продажах", parse_mode="HTML")
                 return
             
             # Показываем только последние 10 продаж
             recent_sales = sales[:10]
             message = format_sales(recent_sales)
-            send_telegram_notification(message)
-            update.message.reply_text(f"ℹ️ Показано последних {len(recent_sales)} продаж", parse_mode="HTML")
-        else:
-            update.message.reply_text("🔐 Ошибка авторизации", parse_mode="HTML")
-    except Exception as e:
-        update.message.reply_text(f"❌ Ошибка: {str(e)}", parse_mode="HTML")
-        logger.error(f"Ошибка в check_sales_command: {str(e)}")
-    finally:
-        driver.quit()
+            send_telegram_notification(message, account=account)
+            update.message.reply_text(
+                f"{header}ℹ️ Показано последних {len(recent_sales)} продаж, данные обновлены {format_age(age)}",
+                parse_mode="HTML"
+            )
+
+        future = fetch_cached(account, "sales", sales_job, force=force_requested(context))
+        reply_when_done(update, future, "check_sales_command", on_result, account_header(account))
 
 def check_terminals_command(update, context):
-    if update.message.from_user.id not in CONFIG['telegram_admin_ids']:
-        update.message.reply_text("⛔ Доступ запрещен")
+    selected = command_accounts(update, context)
+    if not selected:
         return
     
     update.message.reply_text("🔍 Проверяю состояние аппаратов...")
-    try:
-        driver = init_browser()
-        if login(driver):
-            problems = check_terminals(driver)
-            data = load_data()
-            
-            # Получаем URL текущих проблем
-            current_problem_urls = [problem["url"] for problem in problems]
-            
-            # Находим новые проблемы
-            new_problems = [problem for problem in problems if problem["url"] not in data.get("last_notification_urls", [])]
-            
-            if new_problems:
-                message = format_problems(new_problems)
-                send_telegram_notification(message)
-                # Обновляем сохраненные URL
-                data["last_notification_urls"] = current_problem_urls
-                save_data(data)
-                update.message.reply_text(f"⚠️ Найдено {len(new_problems)} проблем с аппаратами!", parse_mode="HTML")
-            else:
-                update.message.reply_text("✅ Проблем с аппаратами не обнаружено", parse_mode="HTML")
-        else:
-            update.message.reply_text("🔐 Ошибка авторизации", parse_mode="HTML")
-    except Exception as e:
-        update.message.reply_text(f"❌ Ошибка: {str(e)}", parse_mode="HTML")
-        logger.error(f"Ошибка в check_terminals_command: {str(e)}")
-    finally:
-        driver.quit()
+
+    # О новых проблемах всех администраторов уведомляет сама проверка,
+    # здесь показываем текущее состояние запросившему
+    for account in selected:
+        def on_result(problems, age, account=account):
+            update.message.reply_text(
+                f"{account_header(account)}{format_problems(problems)}\n\n🕒 Данные обновлены {format_age(age)}",
+                parse_mode="HTML",
+                disable_web_page_preview=True
+            )
+
+        future = fetch_cached(account, "terminals", terminals_job, force=force_requested(context))
+        reply_when_done(update, future, "check_terminals_command", on_result, account_header(account))
+
+def report_command(update, context):
+    selected = command_accounts(update, context)
+    if not selected:
+        return
+    
+    # Отчет строится по локальной истории, без запуска браузера
+    day = moscow_time().date()
+    if any(arg.lower() == "вчера" for arg in context.args or []):
+        day -= timedelta(days=1)
+    for account in selected:
+        try:
+            update.message.reply_text(account_header(account) + format_report(account, day), parse_mode="HTML")
+        except Exception as e:
+            update.message.reply_text(f"❌ Ошибка: {str(e)}", parse_mode="HTML")
+            logger.error(f"Ошибка в report_command: {str(e)}")
+
+def format_span(spans, stage):
+    span = spans.get(stage)
+    if not span:
+        return "нет данных"
+    return f"{span['last']:.1f} с (среднее {span['sum'] / span['count']:.1f} с, макс. {span['max']:.1f} с)"
 
 def status_command(update, context):
-    status_text = (
-        "🟢 <b>Статус системы</b>\n\n"
-        "Система мониторинга AliveWater работает в штатном режиме\n"
-        f"🕒 Последняя проверка: {moscow_time().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        "Следующая автоматическая проверка через 5 минут"
+    # Метрики общие для процесса - показываем их только владельцам учетных записей
+    selected = command_accounts(update, context)
+    if not selected:
+        return
+    visible = [job for job in scheduled_jobs if job.account in selected]
+    healthy = all(job.last_ok is not False for job in visible)
+    status_text = f"{'🟢' if healthy else '🟠'} <b>Статус системы</b>\n\n"
+    names = {"sales": "Продажи", "terminals": "Аппараты"}
+    for job in visible:
+        if job.last_finished is None:
+            last = "еще не выполнялась"
+        else:
+            result = "✅" if job.last_ok else "❌"
+            last = f"{result} {job.last_finished.strftime('%H:%M:%S')} за {job.last_duration:.1f} с"
+        next_in = max(job.next_run - time.monotonic(), 0)
+        title = f"{job.account.title}: {names[job.kind]}" if len(accounts) > 1 else names[job.kind]
+        status_text += (
+            f"<b>{title}</b>\n"
+            f"🕒 Последняя проверка: {last}\n"
+            f"⏭ Следующая через {next_in / 60:.1f} мин\n\n"
+        )
+
+    counters, gauges, spans = metrics.snapshot()
+    status_text += (
+        "📈 <b>Метрики</b>\n"
+        f"🚀 Запуск браузера: {format_span(spans, 'browser_start')}\n"
+        f"🔐 Вход: {format_span(spans, 'login')}, ошибок: {counters.get('login_failures_total', 0)}\n"
+        f"💳 Разбор продаж: {format_span(spans, 'check_sales')}\n"
+        f"⚠️ Разбор аппаратов: {format_span(spans, 'check_terminals')}\n"
+        f"✉️ Отправка в Telegram: {format_span(spans, 'telegram_send')}\n"
+        f"🛍️ Новых продаж: {counters.get('sales_new_total', 0)}, "
+        f"оповещений отправлено: {counters.get('alerts_sent_total', 0)}\n"
+        f"🔁 Запросов WebDriver: {counters.get('webdriver_round_trips_total', 0)}\n"
+        f"📬 Очередь Telegram: {gauges.get('telegram_queue_depth', 0)}\n"
+        f"🧠 Память Chromium: {gauges.get('chromium_rss_mb', 0):.0f} МБ "
+        f"({gauges.get('browser_pool_browsers', 0)} браузеров на {len(accounts)} учетных записей, "
+        f"переключений {counters.get('browser_account_switches_total', 0)})"
     )
     update.message.reply_text(status_text, parse_mode="HTML")
 
+def sync_sales(account, source, data):
+    # Инкрементальная синхронизация: листаем продажи от новых к старым, пока не
+    # дойдем до сохраненного курсора, и отправляем только еще не виденные продажи.
+    # Возвращает число новых продаж или None, если синхронизация не удалась
+    cursor = data.get("last_sale_id", "")
+    seen = set(data.get("seen_sale_ids", []))
+    max_pages = CONFIG['sales_catchup_max_pages']
+    first_page = []
+    new_sales = []
+    collected = set()
+    reached = False
+    try:
+        for sales in source.iter_sales_pages(max_pages if cursor else 1):
+            if not first_page:
+                first_page = sales
+            account.history.add_sales(sales)
+            metrics.inc("sales_scraped_total", len(sales))
+            # Список идет от новых к старым: все, что ниже курсора или уже виденной
+            # продажи, обработано ранее и не должно отправляться повторно
+            for sale in sales:
+                if sale["number"] == cursor or sale["number"] in seen:
+                    reached = True
+                    break
+                if sale["number"] not in collected:
+                    collected.add(sale["number"])
+                    new_sales.append(sale)
+            # Курсор найден: более старые страницы уже обработаны ранее
+            if reached:
+                break
+    except Exception as e:
+        # Курсор не двигаем, чтобы повторить догрузку в следующем цикле
+        logger.error(f"Ошибка при синхронизации продаж: {str(e)}")
+        return None
+
+    if not first_page:
+        return None
+    result_cache.put((account.name, "sales"), first_page)
+
+    if not cursor:
+        # Первый запуск - не отправляем продажи, только запоминаем текущую страницу
+        logger.info(f"Первый запуск ({account.name}): сохраняю курсор продаж без отправки")
+        new_sales = first_page
+    else:
+        if not reached:
+            logger.warning(f"Курсор продаж {cursor} не найден за {max_pages} страниц, возможен пропуск")
+            send_telegram_notification(
+                f"⚠️ Продажа #{cursor} не найдена на последних {max_pages} страницах, "
+                f"более ранние продажи могли быть пропущены",
+                account=account
+            )
+
+        # Отправляем пачками, начиная с самых старых, чтобы format_sales не обрезал список
+        size = CONFIG['sales_batch_size']
+        batches = [new_sales[i:i + size] for i in range(0, len(new_sales), size)]
+        for batch in reversed(batches):
+            send_telegram_notification(format_sales(batch), kind="sales", account=account)
+        if new_sales:
+            metrics.inc("sales_new_total", len(new_sales))
+            logger.info(f"Найдено {len(new_sales)} новых продаж ({account.name})")
+
+    # Ограниченное множество виденных продаж: самые старые номера вытесняются,
+    # в журнал состояния попадают только новые номера
+    account.state.update(
+        {"last_sale_id": first_page[0]["number"]},
+        append={"seen_sale_ids": [sale["number"] for sale in reversed(new_sales)]}
+    )
+    return len(new_sales) if cursor else 0
+
+def process_terminals(account, problems):
+    # Оповещаем только о переходах состояний аппаратов
+    transitions = account.terminal_tracker.update(problems)
+    if transitions:
+        metrics.inc("terminal_transitions_total", len(transitions))
+        send_telegram_notification(format_transitions(transitions), account=account)
+    return transitions
+
+def monitor_sales(account):
+    reset_wait_stats()
+    try:
+        with portal_session(account) as source:
+            if not source:
+                logger.error(f"Ошибка авторизации при проверке продаж ({account.name})")
+                return None
+
+            # Страницы читаем без блокировки, курсор обновляется одной записью в StateStore
+            with metrics.span("check_sales"):
+                new_count = sync_sales(account, source, account.state.get())
+            account.state.flush()
+            account.history.flush()
+            logger.info(
+                f"Проверка продаж: ожидание страниц {wait_stats.waited:.1f} с, "
+                f"сэкономлено на паузах {saved_wait_time():.1f} с"
+            )
+            return new_count
+    except Exception as e:
+        logger.error(f"Ошибка в monitor_sales ({account.name}): {str(e)}")
+        return None
+
+def monitor_terminals(account):
+    reset_wait_stats()
+    try:
+        with portal_session(account) as source:
+            if not source:
+                logger.error(f"Ошибка авторизации при проверке аппаратов ({account.name})")
+                return None
+
+            with metrics.span("check_terminals"):
+                terminals = source.scan_terminals()
+            problems = [t for t in terminals if t["status"] == "problem"]
+            # В историю пишем и исправные аппараты, иначе по ней не видно восстановлений
+            account.history.add_terminal_statuses(terminals)
+            account.history.flush()
+            process_terminals(account, problems)
+            result_cache.put((account.name, "terminals"), problems)
+            logger.info(
+                f"Проверка аппаратов: ожидание страниц {wait_stats.waited:.1f} с, "
+                f"сэкономлено на паузах {saved_wait_time():.1f} с"
+            )
+            return len(problems)
+    except Exception as e:
+        logger.error(f"Ошибка в monitor_terminals ({account.name}): {str(e)}")
+        return None
+
+def monitor_account(account):
+    return monitor_sales(account), monitor_terminals(account)
+
 def main_monitoring():
+    # Один полный цикл: продажи и аппараты всех учетных записей (режим --once и бенчмарки).
+    # Обе проверки записи идут подряд в одной задаче и берут из пула один и тот же
+    # браузер: параллельный запуск стоил бы второго Chromium и второго входа на портал
     logger.info("Запуск автоматической проверки...")
-    try:
-        driver = init_browser()
-        if login(driver):
-            data = load_data()
-            
-            # Проверка продаж
-            sales = check_sales(driver)
-            
-            if sales:
-                # Находим ID самой последней продажи
-                latest_sale_id = sales[0]["number"] if sales else ""
-                
-                # Если у нас есть сохраненный ID
-                if data.get("last_sale_id"):
-                    # Находим индекс последней сохраненной продажи
-                    found_index = next((i for i, sale in enumerate(sales) if sale["number"] == data["last_sale_id"]), -1)
-                    
-                    # Если нашли, берем все продажи до этого индекса (новые продажи)
-                    if found_index > 0:
-                        new_sales = sales[:found_index]
-                    else:
-                        # Если не нашли, значит это первый запуск или данные устарели
-                        new_sales = []
-                else:
-                    # Первый запуск - не отправляем продажи
-                    new_sales = []
-                
-                # Отправляем новые продажи
-                if new_sales:
-                    message = format_sales(new_sales)
-                    send_telegram_notification(message)
-                    logger.info(f"Найдено {len(new_sales)} новых продаж")
-                
-                # Сохраняем ID последней продажи
-                data["last_sale_id"] = latest_sale_id
-                save_data(data)
-            
-            # Проверка аппаратов
-            problems = check_terminals(driver)
-            current_problem_urls = [problem["url"] for problem in problems]
-            new_problems = [problem for problem in problems if problem["url"] not in data.get("last_notification_urls", [])]
-            if new_problems:
-                send_telegram_notification(format_problems(new_problems))
-                data["last_notification_urls"] = current_problem_urls
-                save_data(data)
-            
-            logger.info("Автоматическая проверка завершена успешно")
+    futures = [
+        jobs.submit("sales", f"{account.name}:once", monitor_account, account)
+        for account in accounts
+    ]
+    results = [future.result() for future in futures]
+    sales_ok = all(sales is not None for sales, _ in results)
+    terminals_ok = all(terminals is not None for _, terminals in results)
+    logger.info(f"Очередь Telegram: {delivery.stats_snapshot()}")
+    if sales_ok and terminals_ok:
+        logger.info("Автоматическая проверка завершена успешно")
+    else:
+        logger.error("Автоматическая проверка завершена с ошибками")
+    return sales_ok and terminals_ok
+
+def is_night():
+    start, end = CONFIG['night_hours']
+    return start <= moscow_time().hour < end
+
+def sales_interval(account, new_sales):
+    # Чем чаще идут продажи, тем чаще проверяем; ночью и без продаж - реже
+    sales_rate = account.sales_rate
+    now = time.monotonic()
+    if sales_rate["measured_at"] is not None:
+        minutes = max((now - sales_rate["measured_at"]) / 60, 0.1)
+        sales_rate["per_minute"] = 0.3 * (new_sales / minutes) + 0.7 * sales_rate["per_minute"]
+    sales_rate["measured_at"] = now
+
+    limits = account.sales_interval
+    upper = limits["night_max"] if is_night() else limits["max"]
+    if sales_rate["per_minute"] <= 0:
+        return upper
+    interval = 60 * CONFIG['sales_per_poll'] / sales_rate["per_minute"]
+    return min(max(interval, limits["min"]), upper)
+
+def terminals_interval(account, problem_count):
+    limits = account.terminals_interval
+    return limits["night"] if is_night() else limits["day"]
+
+class AdaptiveJob:
+    # Периодическая проверка учетной записи со своим интервалом. Следующий запуск
+    # планируется только после завершения предыдущего, поэтому циклы не перекрываются
+    def __init__(self, kind, account, func, next_interval, delay=0.0):
+        self.kind = kind
+        self.account = account
+        self.name = f"{kind}:{account.name}"
+        self.func = func
+        self.next_interval = next_interval
+        self.failures = 0
+        self.future = None
+        self.started = None
+        self.next_run = time.monotonic() + delay
+        self.interval = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_ok = None
+
+    def due(self, now):
+        return self.future is None and now >= self.next_run
+
+    def start(self):
+        self.started = time.monotonic()
+        self.future = jobs.submit(self.kind, f"{self.account.name}:scheduled", self.func, self.account)
+        self.future.add_done_callback(self._finish)
+
+    def _finish(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка задачи {self.name}: {str(e)}")
+            result = None
+
+        finished = time.monotonic()
+        self.last_duration = finished - self.started
+        metrics.observe(f"cycle_{self.kind}", self.last_duration)
+        self.last_finished = moscow_time()
+        self.last_ok = result is not None
+        if result is None:
+            # Экспоненциальная задержка со случайным разбросом при ошибках входа и разбора
+            self.failures += 1
+            delay = min(CONFIG['backoff_max'], CONFIG['backoff_base'] * 2 ** (self.failures - 1))
+            self.interval = random.uniform(delay / 2, delay)
+            self.next_run = finished + self.interval
+            logger.warning(f"Проверка {self.name} не удалась ({self.failures} подряд), повтор через {self.interval:.0f} с")
         else:
-            logger.error("Ошибка авторизации при автоматической проверке")
-    except Exception as e:
-        logger.error(f"Ошибка в main_monitoring: {str(e)}")
-    finally:
-        driver.quit()
+            self.failures = 0
+            self.interval = self.next_interval(self.account, result) * random.uniform(0.9, 1.1)
+            self.next_run = max(self.started + self.interval, finished)
+            logger.info(f"Проверка {self.name} заняла {self.last_duration:.1f} с, следующая через {self.next_run - finished:.0f} с")
+        self.future = None
+        scheduler_wakeup.set()
+
+scheduler_wakeup = threading.Event()
+# Первые проверки учетных записей разнесены по минимальному интервалу продаж,
+# чтобы записи не входили в портал одновременно при запуске
+scheduled_jobs = [
+    AdaptiveJob(kind, account, func, next_interval,
+                delay=index * CONFIG['sales_interval']['min'] / len(accounts))
+    for index, account in enumerate(accounts)
+    for kind, func, next_interval in (
+        ("sales", monitor_sales, sales_interval),
+        ("terminals", monitor_terminals, terminals_interval)
+    )
+]
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Запросы сборщика метрик не пишем в лог
+        pass
+
+def start_metrics_server():
+    if not CONFIG['metrics_port']:
+        return None
+    try:
+        server = ThreadingHTTPServer((CONFIG['metrics_host'], CONFIG['metrics_port']), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик: {str(e)}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Метрики доступны на http://{CONFIG['metrics_host']}:{CONFIG['metrics_port']}/metrics")
+    return server
+
+def run_scheduler():
+    # Справедливое расписание: задач каждого типа запускается не больше job_limits,
+    # первыми идут самые просроченные, поэтому частые записи не вытесняют остальные
+    while True:
+        now = time.monotonic()
+        running = {}
+        for job in scheduled_jobs:
+            if job.future is not None:
+                running[job.kind] = running.get(job.kind, 0) + 1
+        for job in sorted((job for job in scheduled_jobs if job.due(now)), key=lambda job: job.next_run):
+            if running.get(job.kind, 0) < CONFIG['job_limits'][job.kind]:
+                running[job.kind] = running.get(job.kind, 0) + 1
+                job.start()
+        # Задачи, ждущие свободного места, запустятся по сигналу о завершении другой задачи
+        waiting = [job.next_run for job in scheduled_jobs if job.future is None and job.next_run > now]
+        timeout = max(min(waiting) - time.monotonic(), 0.5) if waiting else 60
+        scheduler_wakeup.wait(timeout)
+        scheduler_wakeup.clear()
+
+def migrate_accounts():
+    for account in accounts:
+        data = account.state.get()
+        account.history.migrate(data)
+        account.terminal_tracker.migrate(data)
 
 def main():
-    logger.info("Запуск бота мониторинга...")
+    # Разовый запуск для cron (GitHub Actions): один цикл и дожидаемся отправки уведомлений
+    if "--once" in sys.argv:
+        migrate_accounts()
+        ok = main_monitoring()
+        for account in accounts:
+            account.state.flush(force=True)
+        delivery.drain(CONFIG['once_drain_timeout'])
+        sys.exit(0 if ok else 1)
+
+    logger.info(f"Запуск бота мониторинга: учетных записей {len(accounts)}")
+    start_metrics_server()
+    migrate_accounts()
+    delivery.start()
     
     # Инициализация Telegram бота
     updater = Updater(CONFIG['telegram_token'], use_context=True)
@@ -441,15 +2710,14 @@ def main():
     dispatcher.add_handler(CommandHandler("help", help_command))
     dispatcher.add_handler(CommandHandler("check_sales", check_sales_command))
     dispatcher.add_handler(CommandHandler("check_terminals", check_terminals_command))
+    dispatcher.add_handler(CommandHandler("report", report_command))
     dispatcher.add_handler(CommandHandler("status", status_command))
     
     # Запуск бота
     updater.start_polling()
     
-    # Запуск автоматического мониторинга
-    while True:
-        main_monitoring()
-        time.sleep(300)  # Проверка каждые 5 минут
+    # Запуск автоматического мониторинга: продажи и аппараты по своим расписаниям
+    run_scheduler()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+# Офлайн-бенчмарк монитора на локальном стенде (benchmarks/fake_portal.py):
+# login(), fetch_sales(), scan_terminals() и полный цикл main_monitoring()
+# без обращения к боевому порталу и Telegram.
+#
+# Запуск: python benchmarks/bench_replay.py [--sales N] [--terminals N] [--repeat N] [--backend http]
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_portal
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))
+    return ordered[index]
+
+class Report:
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.rows = []
+        self.chromium_peak = 0.0
+
+    def sample_memory(self):
+        self.chromium_peak = max(self.chromium_peak, self.monitor.browser_pool.rss_mb())
+
+    def measure(self, name, func, repeat, before=None):
+        timings = []
+        round_trips = []
+        tracemalloc.reset_peak()
+        for _ in range(repeat):
+            if before:
+                before()
+            counters_before = self.monitor.metrics.snapshot()[0].get("webdriver_round_trips_total", 0)
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+            counters_after = self.monitor.metrics.snapshot()[0].get("webdriver_round_trips_total", 0)
+            round_trips.append(counters_after - counters_before)
+            self.sample_memory()
+        python_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        self.rows.append((name, timings, sum(round_trips) / len(round_trips), python_peak))
+
+    def print(self):
+        print(f"{'этап':<18}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}{'WebDriver':>11}{'Python, МБ':>12}")
+        for name, timings, round_trips, python_peak in self.rows:
+            print(
+                f"{name:<18}"
+                f"{percentile(timings, 0.5) * 1000:>10.1f}"
+                f"{percentile(timings, 0.9) * 1000:>10.1f}"
+                f"{percentile(timings, 0.99) * 1000:>10.1f}"
+                f"{round_trips:>11.0f}"
+                f"{python_peak:>12.1f}"
+            )
+        print(f"Пиковая память Chromium: {self.chromium_peak:.0f} МБ")
+        counters, _, spans = self.monitor.metrics.snapshot()
+        for name, span in sorted(spans.items()):
+            if name.startswith("navigation_"):
+                page = name[len("navigation_"):]
+                transferred = counters.get(f"navigation_bytes_{page}", 0) / span["count"] / 1024
+                print(f"Загрузка '{page}': в среднем {span['sum'] / span['count'] * 1000:.0f} мс, "
+                      f"{transferred:.0f} КБ")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк монитора на локальном стенде портала")
+    parser.add_argument("--sales", type=int, default=200)
+    parser.add_argument("--terminals", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--problem-share", type=float, default=0.05)
+    parser.add_argument("--new-sales", type=int, default=5, help="новых продаж перед каждым циклом")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", choices=("selenium", "http"), default="selenium")
+    args = parser.parse_args()
+
+    data = fake_portal.PortalData(args.sales, args.terminals, args.page_size, args.problem_share)
+    server = fake_portal.start_portal(data)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # Монитор настраивается через окружение до импорта, состояние пишется во временный каталог
+    workdir = tempfile.mkdtemp(prefix="alivewater-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        "PORTAL_URL": base,
+        "TELEGRAM_API_URL": f"{base}/bot",
+        "TELEGRAM_TOKEN": "123456:benchmark",
+        "LOGIN": data.login,
+        "PASSWORD": data.password,
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "METRICS_PORT": "0",
+        "BACKEND": args.backend
+    })
+    tracemalloc.start()
+    import alivewater_monitor as monitor
+
+    report = Report(monitor)
+    print(f"Стенд {base}: продаж {args.sales}, аппаратов {args.terminals}, бэкенд {args.backend}")
+
+    if args.backend == "selenium":
+        driver = monitor.init_browser()
+        try:
+            report.measure("login", lambda: monitor.login(driver), args.repeat,
+                           before=driver.delete_all_cookies)
+            report.measure("fetch_sales", lambda: monitor.fetch_sales(driver), args.repeat)
+            report.measure("scan_terminals", lambda: monitor.scan_terminals(driver), args.repeat)
+            report.chromium_peak = max(report.chromium_peak, monitor.browser_rss_mb(driver))
+        finally:
+            driver.quit()
+    else:
+        client = monitor.accounts[0].http
+        report.measure("login", client.login, args.repeat)
+        report.measure("fetch_sales", client.fetch_sales, args.repeat)
+        report.measure("scan_terminals", client.scan_terminals, args.repeat)
+
+    # Первый цикл только запоминает курсор, дальше каждый цикл видит новые продажи
+    monitor.main_monitoring()
+
+    def new_activity():
+        data.add_sales(args.new_sales)
+        data.toggle_problems(1)
+
+    report.measure("main_monitoring", monitor.main_monitoring, args.repeat, before=new_activity)
+    monitor.delivery.drain(30)
+    monitor.browser_pool.close()
+
+    report.print()
+    print(f"Запросов к стенду: страниц {data.counters['pages']}, API {data.counters['api']}, "
+          f"входов {data.counters['logins']}; сообщений в Telegram: {len(data.messages)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Микробенчмарк разбора таблицы продаж: поэлементный обход через WebDriver
+# против одного execute_script на сохраненном HTML.
+#
+# Запуск: python benchmarks/bench_sales_scrape.py [--rows N] [--repeat N]
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:benchmark")
+
+import alivewater_monitor as monitor
+from selenium.webdriver.common.by import By
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sales.html")
+
+# Полные пути иконок, содержащие сигнатуры из PAYMENT_SIGNATURES
+ICON_PATHS = [
+    "M0 432c0 26.5 21.5 48 48 48h480c26.5 0 48-21.5 48-48V256H0v176zm528-368v8c0 6.6-5.4 12-12 12H60c-6.6 0-12-5.4-12-12",
+    "M320 144c-53.02 0-96 50.14-96 112 0 61.85 42.98 112 96 112 53 0 96-50.13 96-112 0-61.86-42.98-112-96-112z",
+    "M0 405.3V448c0 35.3 86 64 192 64s192-28.7 192-64v-42.7C342.7 434.4 267.2 448 192 448S41.3 434.4 0 405.3zM320 128c-48.6 0-92.6 9-124.5 23.4",
+    "M256 8C119 8 8 119 8 256s111 248 248 248 248-111 248-248S393 8 256 8z"
+]
+
+def build_fixture(rows):
+    random.seed(rows)
+    body = []
+    for i in range(rows):
+        icons = "".join(
+            f'<svg viewBox="0 0 576 512"><path d="{random.choice(ICON_PATHS)}"></path></svg>'
+            for _ in range(random.randint(1, 3))
+        )
+        body.append(
+            f"<tr><td>{100000 - i}</td><td>ул. Тестовая, {i % 40 + 1}</td>"
+            f"<td>{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}</td><td>{random.randint(1, 19)}</td>"
+            f"<td>{random.randint(5, 150)}</td><td>{icons}</td></tr>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>"
+        "<table><tbody>" + "".join(body) + "</tbody></table></body></html>"
+    )
+
+def legacy_extract_sales(driver):
+    # Прежний способ разбора: отдельный запрос WebDriver на каждый элемент
+    rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
+    sales = []
+    for row in rows:
+        cols = row.find_elements(By.TAG_NAME, "td")
+        if len(cols) >= 5:
+            payment_method = "Не указано"
+            for icon in cols[5].find_elements(By.TAG_NAME, "svg"):
+                for path in icon.find_elements(By.TAG_NAME, "path"):
+                    d_attr = path.get_attribute("d")
+                    if d_attr:
+                        match = next((label for sig, label in monitor.PAYMENT_SIGNATURES if sig in d_attr), None)
+                        if match:
+                            payment_method = match
+                            break
+            sales.append({
+                "number": cols[0].text,
+                "address": cols[1].text,
+                "time": cols[2].text,
+                "liters": cols[3].text,
+                "total": cols[4].text,
+                "payment": payment_method
+            })
+    return sales
+
+def count_round_trips(driver):
+    counter = {"calls": 0}
+    original = driver.execute
+
+    def execute(*args, **kwargs):
+        counter["calls"] += 1
+        return original(*args, **kwargs)
+
+    driver.execute = execute
+    return counter
+
+def measure(name, func, driver, counter, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        counter["calls"] = 0
+        started = time.perf_counter()
+        result = func(driver)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{name:<16} строк: {len(result):>5}  медиана: {timings[len(timings) // 2] * 1000:9.1f} мс  "
+          f"запросов WebDriver: {counter['calls']}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение способов разбора таблицы продаж")
+    parser.add_argument("--rows", type=int, help="сгенерировать синтетическую таблицу из N строк")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--write-fixture", action="store_true", help="перезаписать fixtures/sales.html")
+    args = parser.parse_args()
+
+    if args.write_fixture:
+        with open(FIXTURE, "w", encoding="utf-8") as f:
+            f.write(build_fixture(args.rows or 50))
+        return
+
+    path = FIXTURE
+    if args.rows:
+        fd, path = tempfile.mkstemp(suffix=".html")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(build_fixture(args.rows))
+
+    driver = monitor.init_browser()
+    try:
+        driver.get("file://" + path)
+        counter = count_round_trips(driver)
+        legacy = measure("поэлементно", legacy_extract_sales, driver, counter, args.repeat)
+        single = measure("execute_script", monitor.extract_sales, driver, counter, args.repeat)
+        if legacy != single:
+            print("ВНИМАНИЕ: результаты разбора различаются")
+    finally:
+        driver.quit()
+        if path != FIXTURE:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
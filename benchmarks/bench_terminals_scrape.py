@@ -0,0 +1,104 @@
+# Бенчмарк поиска проблемных аппаратов на синтетическом парке:
+# попарное сравнение HTML через WebDriver против одного прохода внутри страницы.
+#
+# Запуск: python benchmarks/bench_terminals_scrape.py [--terminals N] [--problem-share P]
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:benchmark")
+
+import alivewater_monitor as monitor
+from selenium.webdriver.common.by import By
+
+WARNING_ICON = (
+    '<svg viewBox="64 64 896 896" data-icon="exclamation-circle" width="1em" height="1em">'
+    '<path d="M512 64C264.6 64 64 264.6 64 512s200.6 448 448 448 448-200.6 448-448S759.4 64 512 64z"></path></svg>'
+)
+
+def build_fleet(terminals, problem_share):
+    random.seed(terminals)
+    cards = []
+    problems = 0
+    for i in range(terminals):
+        icon = ""
+        if random.random() < problem_share:
+            icon = WARNING_ICON
+            problems += 1
+        cards.append(
+            f'<div class="terminal-card"><a href="/terminal/{10000 + i}">Аппарат №{i + 1}, '
+            f'ул. Тестовая, {i % 200 + 1}</a><span class="status">онлайн</span>{icon}</div>'
+        )
+    html = (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>"
+        + "".join(cards) + "</body></html>"
+    )
+    return html, problems
+
+def legacy_check_terminals(driver):
+    # Прежний способ: innerHTML каждого родителя против outerHTML каждой иконки
+    warnings = driver.find_elements(By.CSS_SELECTOR, "svg[data-icon='exclamation-circle']")
+    if not warnings:
+        return []
+    problems = []
+    for link in driver.find_elements(By.CSS_SELECTOR, "a[href^='/terminal/']"):
+        parent_html = link.find_element(By.XPATH, "./..").get_attribute("innerHTML")
+        if any(warning.get_attribute("outerHTML") in parent_html for warning in warnings):
+            problems.append({"terminal": link.text, "url": link.get_attribute("href")})
+    return problems
+
+def single_pass_check_terminals(driver):
+    return [t for t in monitor.extract_terminals(driver) if t["status"] == "problem"]
+
+def count_round_trips(driver):
+    counter = {"calls": 0}
+    original = driver.execute
+
+    def execute(*args, **kwargs):
+        counter["calls"] += 1
+        return original(*args, **kwargs)
+
+    driver.execute = execute
+    return counter
+
+def measure(name, func, driver, counter):
+    counter["calls"] = 0
+    started = time.perf_counter()
+    result = func(driver)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<14} проблем: {len(result):>5}  время: {elapsed * 1000:10.1f} мс  "
+          f"запросов WebDriver: {counter['calls']}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение способов поиска проблемных аппаратов")
+    parser.add_argument("--terminals", type=int, default=1000)
+    parser.add_argument("--problem-share", type=float, default=0.05)
+    parser.add_argument("--skip-legacy", action="store_true", help="не запускать медленный прежний способ")
+    args = parser.parse_args()
+
+    html, problems = build_fleet(args.terminals, args.problem_share)
+    fd, path = tempfile.mkstemp(suffix=".html")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(html)
+    print(f"Аппаратов: {args.terminals}, с проблемой: {problems}")
+
+    driver = monitor.init_browser()
+    try:
+        driver.get("file://" + path)
+        counter = count_round_trips(driver)
+        single = measure("один проход", single_pass_check_terminals, driver, counter)
+        if not args.skip_legacy:
+            legacy = measure("попарно", legacy_check_terminals, driver, counter)
+            if [p["url"] for p in legacy] != [p["url"] for p in single]:
+                print("ВНИМАНИЕ: результаты поиска различаются")
+    finally:
+        driver.quit()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+# Локальный стенд вместо my.alivewater.cloud и Telegram Bot API для бенчмарков.
+#
+# Отдает страницу входа со всплывающим окном, таблицу продаж и список аппаратов
+# с пагинацией antd, JSON API для BACKEND=http и поддельный sendMessage.
+#
+# Запуск: python benchmarks/fake_portal.py [--port 8080] [--sales N] [--terminals N]
+import json
+import time
+import random
+import secrets
+import argparse
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Полные пути иконок оплаты, содержащие сигнатуры из PAYMENT_SIGNATURES
+PAYMENT_ICONS = {
+    "card": "M0 432c0 26.5 21.5 48 48 48h480c26.5 0 48-21.5 48-48V256H0v176zm528-368v8c0 6.6-5.4 12-12 12H60c-6.6 0-12-5.4-12-12",
+    "bills": "M320 144c-53.02 0-96 50.14-96 112 0 61.85 42.98 112 96 112 53 0 96-50.13 96-112 0-61.86-42.98-112-96-112z",
+    "coins": "M0 405.3V448c0 35.3 86 64 192 64s192-28.7 192-64v-42.7C342.7 434.4 267.2 448 192 448S41.3 434.4 0 405.3zM320 128c-48.6 0-92.6 9-124.5 23.4"
+}
+
+WARNING_ICON = (
+    '<svg viewBox="64 64 896 896" data-icon="exclamation-circle" width="1em" height="1em">'
+    '<path d="M512 64C264.6 64 64 264.6 64 512s200.6 448 448 448 448-200.6 448-448S759.4 64 512 64z"></path></svg>'
+)
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>AliveWater</title></head>
+<body>{body}</body></html>"""
+
+LOGIN_BODY = """
+<div id="popup" style="position:fixed;top:0;left:0;right:0;padding:20px;background:#fff">
+  Мы используем cookie <button class="ant-btn ant-btn-primary" onclick="this.parentNode.remove()">Принять</button>
+</div>
+<form id="login-form" style="margin-top:80px">
+  <input name="login"><input name="password" type="password">
+  <button type="submit">Войти</button>
+</form>
+<script>
+document.getElementById("login-form").addEventListener("submit", function (event) {
+  event.preventDefault();
+  fetch("/api/auth/login", {
+    method: "POST",
+    credentials: "same-origin",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({login: this.login.value, password: this.password.value})
+  }).then(function (response) {
+    if (response.ok) { location.href = "/"; }
+  });
+});
+</script>
+"""
+
+# Таблица и список перерисовываются на клиенте, как в SPA: следующая страница
+# запрашивается из JSON API по кнопке пагинации
+LIST_BODY = """
+<div class="_container_iuuwv_1">
+  {content}
+  <ul class="ant-pagination">
+    <li class="ant-pagination-next{disabled}"><button type="button">›</button></li>
+  </ul>
+</div>
+<script>
+var page = 1;
+var pages = {pages};
+var icons = {icons};
+var warningIcon = {warning_icon};
+function render(items) {{ {render} }}
+document.querySelector(".ant-pagination-next button").addEventListener("click", function () {{
+  if (page >= pages) {{ return; }}
+  page += 1;
+  document.querySelector(".ant-pagination-next").classList.toggle("ant-pagination-disabled", page >= pages);
+  fetch("{api}?page=" + page, {{credentials: "same-origin"}})
+    .then(function (response) {{ return response.json(); }})
+    .then(function (data) {{ render(data.items); }});
+}});
+</script>
+"""
+
+SALES_RENDER = """
+document.querySelector("table tbody").innerHTML = items.map(function (sale) {
+  return "<tr><td>" + sale.number + "</td><td>" + sale.address + "</td><td>" + sale.time +
+    "</td><td>" + sale.liters + "</td><td>" + sale.total + "</td><td><svg viewBox='0 0 576 512'><path d='" +
+    icons[sale.payment] + "'></path></svg></td></tr>";
+}).join("");
+"""
+
+TERMINALS_RENDER = """
+document.getElementById("terminals").innerHTML = items.map(function (terminal) {
+  return "<div class='terminal-card'><a href='/terminal/" + terminal.id + "'>" + terminal.name +
+    "</a>" + (terminal.warnings.length ? warningIcon : "") + "</div>";
+}).join("");
+"""
+
+class PortalData:
+    # Синтетические продажи и аппараты; новые продажи добавляются в начало списка
+    def __init__(self, sales=200, terminals=100, page_size=20, problem_share=0.05,
+                 login="bench", password="bench"):
+        self.page_size = page_size
+        self.login = login
+        self.password = password
+        self.tokens = set()
+        self.messages = []
+        self.counters = {"logins": 0, "pages": 0, "api": 0}
+        self._lock = threading.Lock()
+        self._random = random.Random(sales * 31 + terminals)
+        self._next_number = 100000
+        self.sales = []
+        self.add_sales(sales)
+        self.terminals = [
+            {
+                "id": str(5000 + i),
+                "name": f"Аппарат №{i + 1}, ул. Тестовая, {i % 200 + 1}",
+                "status": "online",
+                "warnings": ["no_water"] if self._random.random() < problem_share else []
+            }
+            for i in range(terminals)
+        ]
+
+    def add_sales(self, count):
+        now = datetime.utcnow() + timedelta(hours=3)
+        with self._lock:
+            fresh = []
+            for i in range(count):
+                self._next_number += 1
+                fresh.append({
+                    "number": str(self._next_number),
+                    "address": f"ул. Тестовая, {self._next_number % 40 + 1}",
+                    "time": (now - timedelta(seconds=count - i)).strftime("%H:%M:%S"),
+                    "liters": str(self._random.randint(1, 19)),
+                    "total": str(self._random.randint(5, 150)),
+                    "payment": self._random.choice(list(PAYMENT_ICONS))
+                })
+            self.sales[:0] = reversed(fresh)
+
+    def toggle_problems(self, count):
+        # Меняем состояние нескольких аппаратов, чтобы проверить оповещения о переходах
+        with self._lock:
+            for terminal in self._random.sample(self.terminals, min(count, len(self.terminals))):
+                terminal["warnings"] = [] if terminal["warnings"] else ["no_water"]
+
+    def page(self, items, page):
+        with self._lock:
+            start = (page - 1) * self.page_size
+            return list(items[start:start + self.page_size])
+
+    def pages(self, items):
+        return max(1, -(-len(items) // self.page_size))
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def data(self):
+        return self.server.data
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        payload = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False), "application/json", headers)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+
+    def _authorized(self):
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "session":
+                token = token or value
+        return token in self.data.tokens
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+
+        if url.path.startswith("/api/"):
+            self.data.counters["api"] += 1
+            if not self._authorized():
+                self._json(401, {"error": "unauthorized"})
+            elif url.path == "/api/sales":
+                self._json(200, {"items": self.data.page(self.data.sales, page)})
+            elif url.path == "/api/terminals":
+                self._json(200, {"items": self.data.page(self.data.terminals, page)})
+            else:
+                self._json(404, {"error": "not found"})
+            return
+
+        if url.path not in ("/", "/sales", "/terminals"):
+            self._send(404, PAGE.format(body="Not found"))
+            return
+
+        self.data.counters["pages"] += 1
+        # Без сессии SPA показывает форму входа по любому адресу
+        if not self._authorized():
+            self._send(200, PAGE.format(body=LOGIN_BODY))
+        elif url.path == "/":
+            self._send(200, PAGE.format(body='<div class="_container_iuuwv_1">Личный кабинет</div>'))
+        elif url.path == "/sales":
+            self._send(200, PAGE.format(body=self._list_body(
+                self.data.sales, "/api/sales", SALES_RENDER, "<table><tbody></tbody></table>"
+            )))
+        else:
+            self._send(200, PAGE.format(body=self._list_body(
+                self.data.terminals, "/api/terminals", TERMINALS_RENDER, '<div id="terminals"></div>'
+            )))
+
+    def _list_body(self, items, api, render, content):
+        pages = self.data.pages(items)
+        first_page = json.dumps(self.data.page(items, 1), ensure_ascii=False)
+        body = LIST_BODY.format(
+            content=content,
+            disabled=" ant-pagination-disabled" if pages <= 1 else "",
+            pages=pages,
+            icons=json.dumps(PAYMENT_ICONS),
+            warning_icon=json.dumps(WARNING_ICON),
+            render=render,
+            api=api
+        )
+        return body + f"<script>render({first_page});</script>"
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        payload = self._read_json()
+
+        if url.path == "/api/auth/login":
+            self.data.counters["logins"] += 1
+            if payload.get("login") != self.data.login or payload.get("password") != self.data.password:
+                self._json(401, {"error": "invalid credentials"})
+                return
+            token = secrets.token_hex(16)
+            self.data.tokens.add(token)
+            self._json(200, {"token": token}, {"Set-Cookie": f"session={token}; Path=/; HttpOnly"})
+            return
+
+        # Поддельный Telegram Bot API: /bot<token>/<method>
+        if url.path.startswith("/bot"):
+            method = url.path.rsplit("/", 1)[-1]
+            if method == "sendMessage":
+                with self.data._lock:
+                    self.data.messages.append(payload)
+                    message_id = len(self.data.messages)
+                self._json(200, {"ok": True, "result": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": int(payload.get("chat_id", 0)), "type": "private"},
+                    "text": payload.get("text", "")
+                }})
+            else:
+                self._json(200, {"ok": True, "result": True})
+            return
+
+        self._json(404, {"error": "not found"})
+
+def start_portal(data, host="127.0.0.1", port=0):
+    # Запускает стенд в фоновом потоке; port=0 - любой свободный порт
+    server = ThreadingHTTPServer((host, port), PortalHandler)
+    server.daemon_threads = True
+    server.data = data
+    threading.Thread(target=server.serve_forever, name="fake-portal", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд портала AliveWater и Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sales", type=int, default=200)
+    parser.add_argument("--terminals", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--problem-share", type=float, default=0.05)
+    parser.add_argument("--login", default="bench")
+    parser.add_argument("--password", default="bench")
+    args = parser.parse_args()
+
+    data = PortalData(args.sales, args.terminals, args.page_size, args.problem_share, args.login, args.password)
+    server = ThreadingHTTPServer((args.host, args.port), PortalHandler)
+    server.data = data
+    print(f"Стенд: PORTAL_URL=http://{args.host}:{args.port} "
+          f"TELEGRAM_API_URL=http://{args.host}:{args.port}/bot")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import pytest
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    for module in ("selenium", "telegram", "urllib3"):
+        pytest.importorskip(module)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TELEGRAM_TOKEN", "123456:test")
+    monkeypatch.setenv("HISTORY_DB", str(tmp_path / "history.db"))
+    monkeypatch.setenv("METRICS_PORT", "0")
+    import alivewater_monitor
+    return alivewater_monitor
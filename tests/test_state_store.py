@@ -0,0 +1,32 @@
+import glob
+
+def test_unjournaled_update_survives_other_process(monitor, tmp_path):
+    path = str(tmp_path / "data.json")
+    first = monitor.StateStore(path, journal=False)
+    second = monitor.StateStore(path, journal=False)
+    first.get()
+    second.get()
+
+    first.update({"last_sale_id": "101"})
+    second.update(append={"seen_sale_ids": ["102"]})
+    second.flush(force=True)
+
+    assert first.get()["last_sale_id"] == "101"
+    state = monitor.StateStore(path, journal=False).get()
+    assert state["last_sale_id"] == "101"
+    assert state["seen_sale_ids"] == ["102"]
+
+def test_journal_replayed_over_backup_after_corrupt_snapshot(monitor, tmp_path):
+    path = str(tmp_path / "data.json")
+    store = monitor.StateStore(path)
+    store.update({"last_sale_id": "1"})
+    store.flush(force=True)
+    store.update({"last_sale_id": "2"})
+    store.flush(force=True)
+    store.update({"last_sale_id": "3"})
+    with open(path, "w") as f:
+        f.write("{")
+
+    state = monitor.StateStore(path).get()
+    assert state["last_sale_id"] == "3"
+    assert glob.glob(f"{path}.corrupt-*")
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+def sale(number):
+    return {"number": str(number), "address": "ул. Тестовая, 1", "time": "12:00:00",
+            "liters": "5", "total": "25", "payment": "💳 Карта"}
+
+class PagesSource:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def iter_sales_pages(self, max_pages):
+        return iter(self.pages[:max_pages])
+
+@pytest.fixture
+def sent(monitor, monkeypatch):
+    batches = []
+    monkeypatch.setattr(monitor, "format_sales", lambda sales: [s["number"] for s in sales])
+    monkeypatch.setattr(monitor, "send_telegram_notification",
+                        lambda message, kind="info", account=None: batches.append(message))
+    return batches
+
+def make_account(monitor, tmp_path, data):
+    state_dir = tmp_path / "account"
+    state_dir.mkdir()
+    (state_dir / "data.json").write_text(json.dumps(data))
+    return monitor.Account("test", "login", "password", [1], state_dir=str(state_dir))
+
+def test_legacy_cursor_stops_at_cursor(monitor, sent, tmp_path):
+    # Прежний формат data.json: только курсор, без seen_sale_ids
+    account = make_account(monitor, tmp_path, {"last_sale_id": "103"})
+    source = PagesSource([[sale(n) for n in (105, 104, 103, 102, 101)]])
+
+    assert monitor.sync_sales(account, source, account.state.get()) == 2
+    assert sent == [["105", "104"]]
+    assert account.state.get()["last_sale_id"] == "105"
+
+def test_seen_sale_stops_scan(monitor, sent, tmp_path):
+    # Курсор пропал со страницы, но более старая продажа уже была отправлена
+    account = make_account(monitor, tmp_path, {"last_sale_id": "99", "seen_sale_ids": ["102", "101"]})
+    source = PagesSource([[sale(n) for n in (104, 103, 102, 101)]])
+
+    assert monitor.sync_sales(account, source, account.state.get()) == 2
+    assert sent[-1] == ["104", "103"]
@@ -0,0 +1,17 @@
+def test_backed_off_head_blocks_chat(monitor, tmp_path):
+    outbox = monitor.TelegramOutbox(str(tmp_path / "outbox.db"))
+    outbox.put(1, "info", ["первое"])
+    head_id = outbox.take(1)[0][0]
+    outbox.retry([head_id], 60)
+    outbox.put(1, "info", ["второе"])
+    outbox.put(2, "info", ["другой чат"])
+
+    # Второе сообщение уже пора отправлять, но порядок держит первое
+    assert outbox.due_chats() == [2]
+    assert outbox.take(1) == []
+
+def test_due_head_releases_chat(monitor, tmp_path):
+    outbox = monitor.TelegramOutbox(str(tmp_path / "outbox.db"))
+    outbox.put(1, "info", ["первое", "второе"])
+    assert outbox.due_chats() == [1]
+    assert [row[2] for row in outbox.take(1)] == ["первое", "второе"]
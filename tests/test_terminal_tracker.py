@@ -0,0 +1,18 @@
+PROBLEM = {"id": "7", "terminal": "Аппарат 7", "url": "https://portal/terminals/7", "warning": "Нет воды"}
+
+def test_unchanged_problem_is_not_rewritten(monitor, tmp_path):
+    tracker = monitor.TerminalTracker(str(tmp_path / "history.db"))
+    saved = []
+    save = tracker._save
+    tracker._save = lambda records: (saved.append([r["id"] for r in records]), save(records))
+
+    assert [kind for kind, _ in tracker.update([PROBLEM], now=100)] == ["new"]
+    assert tracker.update([PROBLEM], now=200) == []
+    assert tracker.update([], now=300) == []
+    assert [kind for kind, _ in tracker.update([], now=400)] == ["resolved"]
+    assert saved == [["7"], [], ["7"], ["7"]]
+
+    record = monitor.TerminalTracker(str(tmp_path / "history.db")).records["7"]
+    assert record["state"] == "ok"
+    assert record["last_seen"] == 200
+    assert record["resolved_at"] == 400